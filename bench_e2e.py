@@ -0,0 +1,244 @@
+"""Офлайн бенчмарк process_file против локального стенда вместо kaspi.kz.
+
+Стенд отдает записанные страницы выдачи (по умолчанию last_response.html) на
+/shop/search/?text= с заданной задержкой. Если в странице нет __NEXT_DATA__,
+в нее подставляется JSON с товарами из каталога, собранного по названиям входного файла.
+
+Пример: python bench_e2e.py --input doc1000.xlsx --latency 300 --workers 8 --report bench_history.jsonl
+"""
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+import pandas as pd
+
+class StandInServer(ThreadingHTTPServer):
+    """Локальный заменитель страницы поиска Kaspi."""
+    daemon_threads = True
+
+    def __init__(self, pages, catalog, latency=0.0, jitter=0.0, page_size=12, counter=None):
+        super().__init__(('127.0.0.1', 0), StandInHandler)
+        self.pages = pages
+        self.catalog = catalog
+        self.latency = latency
+        self.jitter = jitter
+        self.page_size = page_size
+        self.requests = 0
+        # Общий с процессом бенчмарка счетчик запросов (multiprocessing.Value), если стенд в отдельном процессе
+        self.counter = counter
+        self._lock = threading.Lock()
+        # Индекс каталога по первому слову названия
+        self.by_word = {}
+        for product in catalog:
+            words = product['name'].lower().split()
+            if words:
+                self.by_word.setdefault(words[0], []).append(product)
+
+    def products_for(self, text):
+        words = text.lower().split()
+        found = list(self.by_word.get(words[0], [])) if words else []
+        # Добиваем выдачу до размера страницы посторонними товарами
+        if len(found) < self.page_size and self.catalog:
+            start = sum(map(ord, text)) % len(self.catalog)
+            found += [self.catalog[(start + i) % len(self.catalog)] for i in range(self.page_size - len(found))]
+        return found[:self.page_size]
+
+    def render(self, text):
+        page = self.pages[sum(map(ord, text)) % len(self.pages)]
+        if '__NEXT_DATA__' in page:
+            return page
+        data = {'props': {'pageProps': {'initialData': {'data': {'products': self.products_for(text)}}}}}
+        blob = f'<script id="__NEXT_DATA__" type="application/json">{json.dumps(data, ensure_ascii=False)}</script>'
+        head, sep, tail = page.rpartition('</body>')
+        return f"{head}{blob}{sep}{tail}" if sep else page + blob
+
+    def count_request(self):
+        with self._lock:
+            self.requests += 1
+        if self.counter is not None:
+            with self.counter.get_lock():
+                self.counter.value += 1
+
+class StandInHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        parsed = urlparse(self.path)
+        if parsed.path.rstrip('/') != '/shop/search':
+            self.send_error(404)
+            return
+        self.server.count_request()
+        text = parse_qs(parsed.query).get('text', [''])[0]
+        delay = self.server.latency + random.uniform(-self.server.jitter, self.server.jitter)
+        if delay > 0:
+            time.sleep(delay)
+        body = self.server.render(text).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+def _serve_stand(pages, catalog, latency, jitter, counter, ready):
+    server = StandInServer(pages, catalog, latency=latency, jitter=jitter, counter=counter)
+    ready.put(server.server_address[1])
+    server.serve_forever()
+
+def start_stand(pages, catalog, latency=0.0, jitter=0.0):
+    """Запускает стенд в отдельном процессе, чтобы его память и потоки не попадали в замер:
+    (процесс, порт, счетчик запросов)."""
+    context = multiprocessing.get_context('spawn')
+    counter = context.Value('i', 0)
+    ready = context.Queue()
+    process = context.Process(target=_serve_stand, args=(pages, catalog, latency, jitter, counter, ready),
+                              name='bench-stand', daemon=True)
+    process.start()
+    return process, ready.get(timeout=60), counter
+
+def build_catalog(input_path, input_col, sheet_name=None):
+    """Каталог стенда: товары с названиями строк входного файла в стиле Kaspi."""
+    df = pd.read_excel(input_path, sheet_name=sheet_name or 0)
+    catalog = []
+    for i, title in enumerate(df[input_col].dropna().astype(str).unique()):
+        name = ' '.join(part.strip() for part in title.split('/') if part.strip())
+        catalog.append({
+            'id': 100000000 + i,
+            'name': name,
+            'price': 10000 + (i * 7919) % 900000,
+            'category': {'name': 'Электроника', 'parentCategory': {'name': 'Bench'}},
+        })
+    return catalog
+
+def percentile(values, q):
+    if not values:
+        return None
+    values = sorted(values)
+    index = min(len(values) - 1, max(0, int(round(q / 100 * len(values) + 0.5)) - 1))
+    return values[index]
+
+def peak_rss_mb():
+    """Пиковый RSS процесса (ru_maxrss: КБ в Linux, байты в macOS)."""
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(rss / (1024 * 1024) if sys.platform == 'darwin' else rss / 1024, 1)
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+def main():
+    parser = argparse.ArgumentParser(description='Offline end-to-end benchmark of process_file')
+    parser.add_argument('--input', '-i', default='doc1000.xlsx', help='Input Excel file')
+    parser.add_argument('--col', '-c', default='Номенклатура поставщика', help='Column name with queries')
+    parser.add_argument('--pages', nargs='+', default=['last_response.html'], help='Recorded search pages to serve')
+    parser.add_argument('--latency', type=float, default=200, help='Server latency per request, ms')
+    parser.add_argument('--jitter', type=float, default=50, help='Random latency jitter, +/- ms')
+    parser.add_argument('--workers', '-w', type=int, default=None, help='Workers for process_file (default MAX_WORKERS)')
+    parser.add_argument('--max-rows', type=int, default=None, help='Limit input rows')
+    parser.add_argument('--shards', type=int, default=None, help='Run process_file_sharded with N processes (0 = one per core)')
+    parser.add_argument('--no-pipeline', action='store_true', help='Search rows with process_query per thread instead of the stage pipeline')
+    parser.add_argument('--cache', action='store_true', help='Keep the search cache and local catalog enabled (fresh files in the output dir)')
+    parser.add_argument('--report', default=None, help='Append the JSON result as one line to this file')
+    parser.add_argument('--verbose', action='store_true', help='Keep INFO logging of the pipeline')
+    args = parser.parse_args()
+
+    # Локальный стенд не должен идти через системный прокси
+    os.environ['NO_PROXY'] = '127.0.0.1,localhost'
+    os.environ['no_proxy'] = os.environ['NO_PROXY']
+
+    import main as pipeline
+    import kaspi_api
+    import proxy_pool
+    from config import MAX_WORKERS
+    from journal import load_journals
+
+    if not args.verbose:
+        logging.getLogger().setLevel(logging.WARNING)
+    out_dir = tempfile.mkdtemp(prefix='bench_e2e_')
+    # Товары стенда выдуманы: кэш и каталог живут во временной папке, а не в ./cache,
+    # иначе настоящие запуски находили бы их как совпадения
+    stores = {'cache_path': os.path.join(out_dir, 'search_cache.sqlite'),
+              'catalog_path': os.path.join(out_dir, 'catalog.sqlite')}
+    pipeline.set_cache_path(stores['cache_path'])
+    pipeline.set_catalog_path(stores['catalog_path'])
+    if not args.cache:
+        pipeline.disable_cache()
+        pipeline.disable_catalog()
+    if args.no_pipeline:
+        pipeline.set_pipeline(False)
+
+    pages = []
+    for path in args.pages:
+        with open(path, encoding='utf-8') as f:
+            pages.append(f.read())
+    stand, port, stand_requests = start_stand(pages, build_catalog(args.input, args.col),
+                                              latency=args.latency / 1000, jitter=args.jitter / 1000)
+    base_url = f"http://127.0.0.1:{port}"
+    kaspi_api.set_base_url(base_url)
+    kaspi_api.set_fetch_mode('http')
+    # Стенд не банит: паузы и лимиты планировщика прокси только исказили бы замер
+    unlimited = {'proxies': [], 'rate': 0, 'min_delay': 0, 'max_delay': 0}
+    proxy_pool.configure(**unlimited)
+
+    workers = args.workers or MAX_WORKERS
+    started = time.perf_counter()
+    if args.shards is not None:
+        settings = dict(stores, fetch_mode='http', base_url=base_url, cache=args.cache, catalog=args.cache,
+                        pipeline=not args.no_pipeline, proxy=unlimited)
+        pipeline.process_file_sharded(args.input, input_col=args.col, out_dir=out_dir, max_rows=args.max_rows,
+                                      workers=workers, shards=args.shards or None, settings=settings)
+    else:
+        pipeline.process_file(args.input, input_col=args.col, out_dir=out_dir, max_rows=args.max_rows, workers=workers)
+    elapsed = time.perf_counter() - started
+    stand.terminate()
+    stand.join()
+
+    base_name = os.path.splitext(os.path.basename(args.input))[0]
+    rows = load_journals(out_dir, base_name)
+    # Повторные строки получили результат чужого поиска: время считаем только у искавших строк
+    latencies = [entry['elapsed'] * 1000 for entry in rows.values()
+                 if entry.get('elapsed') is not None and not entry.get('duplicate')]
+    found = sum(1 for entry in rows.values() if entry.get('best_id'))
+
+    result = {
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'revision': git_revision(),
+        'params': {'input': args.input, 'max_rows': args.max_rows, 'workers': workers,
+                   'latency_ms': args.latency, 'jitter_ms': args.jitter, 'cache': args.cache,
+                   'shards': args.shards, 'pipeline': not args.no_pipeline},
+        'rows': len(rows),
+        'found': found,
+        'elapsed_s': round(elapsed, 3),
+        'rows_per_sec': round(len(rows) / elapsed, 3) if elapsed else None,
+        'row_latency_ms': {
+            'p50': round(percentile(latencies, 50), 1) if latencies else None,
+            'p95': round(percentile(latencies, 95), 1) if latencies else None,
+            'max': round(max(latencies), 1) if latencies else None,
+        },
+        'fetches': stand_requests.value,
+        'fetches_per_row': round(stand_requests.value / len(rows), 3) if rows else None,
+        'peak_rss_mb': peak_rss_mb(),
+        'output_dir': out_dir,
+    }
+    print(json.dumps(result, ensure_ascii=False, indent=2))
+    if args.report:
+        with open(args.report, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(result, ensure_ascii=False) + '\n')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,61 @@
+"""Микро-бенчмарк разбора страницы выдачи Kaspi.
+
+Пример: python bench_parse.py last_response.html --repeat 50 --json
+"""
+import argparse
+import json
+import time
+from bs4 import BeautifulSoup
+import kaspi_api
+
+def legacy_parse(html):
+    """Прежний путь fetch_search_results: полное дерево html.parser и CSS-селекторы."""
+    soup = BeautifulSoup(html, 'html.parser')
+    return soup.select('div.item-card')
+
+def bench(func, html, repeat):
+    """Среднее время одного вызова в миллисекундах."""
+    func(html)  # прогрев
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func(html)
+    return (time.perf_counter() - start) / repeat * 1000
+
+def main():
+    parser = argparse.ArgumentParser(description='Parse time per search page')
+    parser.add_argument('pages', nargs='*', default=['last_response.html'], help='Saved search result pages')
+    parser.add_argument('--repeat', type=int, default=20, help='Parses per page and method')
+    parser.add_argument('--json', action='store_true', help='Print results as JSON')
+    args = parser.parse_args()
+
+    methods = {
+        'legacy_bs4_full': legacy_parse,
+        'next_data_json': kaspi_api.parse_next_data,
+        'cards_soup_strainer': lambda html: list(kaspi_api._parse_cards_soup(html)),
+        'extract_products': kaspi_api.extract_products,
+    }
+    if kaspi_api.lxml_available():
+        methods['cards_lxml'] = lambda html: list(kaspi_api._parse_cards_lxml(html))
+
+    report = []
+    for page in args.pages:
+        with open(page, encoding='utf-8') as f:
+            html = f.read()
+        row = {
+            'page': page,
+            'bytes': len(html.encode('utf-8')),
+            'products': len(kaspi_api.extract_products(html)),
+            'ms_per_page': {name: round(bench(func, html, args.repeat), 3) for name, func in methods.items()},
+        }
+        report.append(row)
+
+    if args.json:
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+        return
+    for row in report:
+        print(f"{row['page']}: {row['bytes']} bytes, {row['products']} products")
+        for name, ms in row['ms_per_page'].items():
+            print(f"  {name:<22} {ms:9.3f} ms")
+
+if __name__ == '__main__':
+    main()
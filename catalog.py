@@ -0,0 +1,142 @@
+import logging
+import os
+import sqlite3
+import threading
+import time
+from config import CATALOG_PATH, CATALOG_PRICE_TTL, CATALOG_CANDIDATES
+from matching import preprocess_text
+
+# Не больше стольких n-грамм запроса уходит в поиск по индексу
+MAX_QUERY_GRAMS = 400
+
+def title_grams(title):
+    """Ключи инвертированного индекса: слова и символьные триграммы нормализованного названия."""
+    text = preprocess_text(title or '')
+    grams = set()
+    for word in text.split():
+        if len(word) >= 2:
+            grams.add('w:' + word)
+        padded = f" {word} "
+        for i in range(len(padded) - 2):
+            grams.add('g:' + padded[i:i + 3])
+    return grams
+
+class ProductCatalog:
+    """Локальный каталог товаров Kaspi, накопленный из всех поисков, с индексом по словам и триграммам."""
+
+    def __init__(self, path=CATALOG_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS products (
+                id TEXT PRIMARY KEY,
+                title TEXT NOT NULL,
+                price REAL,
+                category TEXT,
+                url TEXT,
+                updated_at REAL NOT NULL
+            )""")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS grams (
+                gram TEXT NOT NULL,
+                product_id TEXT NOT NULL,
+                PRIMARY KEY (gram, product_id)
+            ) WITHOUT ROWID""")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_grams_product ON grams(product_id)")
+        self._conn.commit()
+
+    def add_products(self, products):
+        """Добавляет или обновляет товары; индекс пересчитывается только при смене названия."""
+        now = time.time()
+        with self._lock:
+            for product in products:
+                product_id = product.get('id')
+                title = product.get('title')
+                if not product_id or not title:
+                    continue
+                product_id = str(product_id)
+                row = self._conn.execute("SELECT title FROM products WHERE id = ?", (product_id,)).fetchone()
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO products (id, title, price, category, url, updated_at) VALUES (?, ?, ?, ?, ?, ?)",
+                    (product_id, title, product.get('price'), product.get('category') or '', product.get('url'), now))
+                if row is None or row[0] != title:
+                    self._conn.execute("DELETE FROM grams WHERE product_id = ?", (product_id,))
+                    self._conn.executemany(
+                        "INSERT OR IGNORE INTO grams (gram, product_id) VALUES (?, ?)",
+                        [(gram, product_id) for gram in title_grams(title)])
+            self._conn.commit()
+
+    def candidates(self, query, limit=CATALOG_CANDIDATES):
+        """Товары каталога с наибольшим числом общих n-грамм с запросом, в формате fetch_search_results.
+        Ключ '_updated_at' - время последнего обновления цены."""
+        grams = sorted(title_grams(query))[:MAX_QUERY_GRAMS]
+        if not grams:
+            return []
+        placeholders = ','.join('?' * len(grams))
+        with self._lock:
+            rows = self._conn.execute(f"""
+                SELECT p.id, p.title, p.price, p.category, p.url, p.updated_at
+                FROM (SELECT product_id, COUNT(*) AS hits FROM grams
+                      WHERE gram IN ({placeholders}) GROUP BY product_id
+                      ORDER BY hits DESC LIMIT ?) AS g
+                JOIN products AS p ON p.id = g.product_id
+                ORDER BY g.hits DESC""", (*grams, limit)).fetchall()
+        return [{
+            'id': product_id,
+            'title': title,
+            'price': price,
+            'category': category,
+            'url': url,
+            '_updated_at': updated_at,
+        } for product_id, title, price, category, url, updated_at in rows]
+
+    def is_fresh(self, product, ttl=CATALOG_PRICE_TTL):
+        return not ttl or time.time() - product.get('_updated_at', 0) <= ttl
+
+    def size(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM products").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+# Глобальный каталог процесса; None - каталог отключен
+_catalog = None
+_catalog_enabled = True
+_catalog_path = CATALOG_PATH
+_catalog_lock = threading.Lock()
+
+def get_catalog():
+    """Возвращает каталог процесса (создается при первом обращении) или None, если он отключен."""
+    global _catalog
+    if not _catalog_enabled:
+        return None
+    with _catalog_lock:
+        if _catalog is None:
+            _catalog = ProductCatalog(_catalog_path)
+            logging.info(f"Local catalog {_catalog.path}: {_catalog.size()} products")
+        return _catalog
+
+def set_catalog_path(path):
+    """Файл каталога процесса (bench_e2e.py держит товары стенда отдельно от настоящих)."""
+    global _catalog_path, _catalog
+    with _catalog_lock:
+        _catalog_path = path
+        if _catalog is not None:
+            _catalog.close()
+            _catalog = None
+
+def disable_catalog():
+    """Отключает локальный каталог для текущего запуска (--no-catalog)."""
+    global _catalog_enabled, _catalog
+    with _catalog_lock:
+        _catalog_enabled = False
+        if _catalog is not None:
+            _catalog.close()
+            _catalog = None
@@ -4,21 +4,105 @@
 # Leave empty for no proxy during testing.
 PROXIES = []
 
+# Site root for search pages (overridden by bench_e2e.py with a local stand-in server)
+KASPI_BASE_URL = "https://kaspi.kz"
+
 # Default headers (User-Agent will be randomized normally)
 TIMEOUT = 20  # seconds per request
-MAX_WORKERS = 5  # concurrency for async extensions (not used in simple sync version)
+READY_TIMEOUT = 10  # max seconds to wait for search results to settle in the browser
+READY_SETTLE = 0.5  # seconds the product card count must stay unchanged
+MAX_WORKERS = 5  # parallel workers / size of the browser pool
+
+# chromedriver: explicit path, or empty to resolve it once with webdriver_manager
+# and reuse the path saved in DRIVER_PATH_CACHE on later runs.
+CHROMEDRIVER_PATH = ""
+DRIVER_PATH_CACHE = "./cache/chromedriver_path.txt"
+
+# Lean browser: eager page loads, images/media/fonts and third-party trackers blocked via CDP.
+LEAN_BROWSER = True
+# A pooled browser is restarted after this many searches or when Chrome's memory
+# (all its processes, needs psutil) exceeds DRIVER_MAX_RSS_MB. 0 = no limit.
+DRIVER_MAX_PAGES = 200
+DRIVER_MAX_RSS_MB = 1500
+PARALLEL_VARIANTS = False  # search all query variants of a row at once (more load per row, lower latency)
 CHUNK_SIZE = 5000  # rows per output file
+# Output parts: "xlsx" (xlsxwriter if installed, else openpyxl), "csv" or "parquet" (needs pyarrow).
+OUTPUT_FORMAT = "xlsx"
+WRITE_WORKERS = 0  # processes writing output parts in parallel (0 = one per CPU core)
+COMBINED_FORMAT = ""  # also write all rows to one "parquet" or "csv" file ("" = off)
+# Rows go through stages plan -> fetch -> parse -> score connected by bounded queues,
+# so parsing and scoring overlap with page loads. Fetch uses --workers threads.
+PIPELINE = True
+PIPELINE_PLAN_WORKERS = 1
+PIPELINE_PARSE_WORKERS = 2
+PIPELINE_SCORE_WORKERS = 1
+PIPELINE_QUEUE_SIZE = 16  # items waiting in front of each stage
+STREAM_BATCH_SIZE = 200  # rows read, searched and written together in --stream mode
+
+# How search pages are fetched: "http" reads __NEXT_DATA__ with plain requests
+# and falls back to Selenium when the blob is missing; "browser" always uses Selenium.
+FETCH_MODE = "http"
+
+# Whether specs extracted from the query (RAM, storage, CPU) are applied as site
+# filters. Off by default: unfiltered results are fetched once and matching.py
+# drops RAM/storage conflicts and scores the specs itself.
+APPLY_SITE_FILTERS = False
+
+# How spec filters are applied: "url" reads the facet codes from the filter data of the
+# unfiltered results page and loads the filtered page in one navigation (also without a
+# browser), falling back to sidebar clicks when the page has no such facets; "click" always
+# uses the sidebar (browser fetches only).
+FILTER_MODE = "url"
+
+# On-disk search result cache (SQLite). TTL in seconds, 0 = never expires.
+CACHE_PATH = "./cache/search_cache.sqlite"
+CACHE_TTL = 3 * 24 * 3600
+CACHE_MAX_ENTRIES = 200000
+
+# Local product catalog accumulated from all searches (SQLite). A row is matched
+# offline when the best catalog score >= CATALOG_MIN_SCORE and its price is
+# younger than CATALOG_PRICE_TTL seconds.
+CATALOG_PATH = "./cache/catalog.sqlite"
+CATALOG_PRICE_TTL = 24 * 3600
+CATALOG_CANDIDATES = 50
+
+# Capacity of each in-memory LRU cache for text normalization (memo.py)
+MEMO_CACHE_SIZE = 100000
+
+# Matcher service (python main.py --serve): address and how many rows may be
+# queued or in progress at once before requests are rejected with 503.
+SERVICE_HOST = "127.0.0.1"
+SERVICE_PORT = 8765
+SERVICE_MAX_PENDING = 200
 
 # Matching thresholds
 FUZZY_THRESHOLD = 70  # percent; below this we consider trying next candidate
 SECONDARY_THRESHOLD = 40  # percent used in the user's description for GPT fallback
+CATALOG_MIN_SCORE = FUZZY_THRESHOLD  # raise to trust offline catalog matches less
 
 # Optional OpenAI (GPT) settings - leave empty if not using
 OPENAI_API_KEY = ""
 
-# Request delay (randomized between MIN_DELAY and MAX_DELAY seconds)
+# Pause between requests of one worker (its HTTP session or browser), randomized between
+# MIN_DELAY and MAX_DELAY seconds. Workers are paced independently; set both to 0 to disable.
 MIN_DELAY = 0.6
 MAX_DELAY = 1.8
 
+# Proxy scheduler (proxy_pool.py): token bucket per proxy (requests/second and burst),
+# a proxy is ejected for PROXY_COOLDOWN seconds (doubling on repeat, at most
+# PROXY_MAX_COOLDOWN) after PROXY_MAX_FAILURES consecutive failed requests.
+# The direct connection has no alternative, so it only pauses for PROXY_DIRECT_COOLDOWN.
+# PROXY_DIRECT_RATE is the token bucket of the direct connection (0 = no limit, only the
+# per-worker pauses above); set e.g. 1.0 to cap all workers on one IP at ~1 request/second.
+# HTTP 429 is not a failure: the proxy pauses for Retry-After (at most PROXY_MAX_COOLDOWN).
+PROXY_RATE = 1.0
+PROXY_DIRECT_RATE = 0
+PROXY_BURST = 3
+PROXY_MAX_FAILURES = 3
+PROXY_COOLDOWN = 60
+PROXY_MAX_COOLDOWN = 600
+PROXY_DIRECT_COOLDOWN = 10
+PROXY_RETRY_AFTER = 10  # pause after 429 without a Retry-After header
+
 # Logging
 LOG_LEVEL = "INFO"
\ No newline at end of file
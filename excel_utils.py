@@ -1,8 +1,78 @@
-import pandas as pd
 import math
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
+from openpyxl import Workbook, load_workbook
+from config import OUTPUT_FORMAT, WRITE_WORKERS, COMBINED_FORMAT
+import metrics
+
+OUTPUT_FORMATS = ('xlsx', 'csv', 'parquet')
+# Меньше стольких строк части пишутся в текущем процессе: запуск процессов дороже записи
+PARALLEL_WRITE_ROWS = 20000
+
+# Настройки выхода процесса (меняются из CLI через set_output)
+_output_format = OUTPUT_FORMAT
+_write_workers = WRITE_WORKERS
+_combined_format = COMBINED_FORMAT or None
+
+def check_output_format(fmt):
+    """Проверяет формат и наличие его необязательной зависимости."""
+    if fmt not in OUTPUT_FORMATS:
+        raise ValueError(f"Unknown output format: {fmt}. Expected one of {OUTPUT_FORMATS}")
+    if fmt == 'parquet':
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            raise ImportError("Parquet output needs pyarrow: pip install pyarrow") from None
+
+def set_output(fmt=None, workers=None, combined=None):
+    """Формат частей выхода, число процессов записи (0 - по числу ядер) и общий файл
+    combined ('parquet' или 'csv', None - не писать)."""
+    global _output_format, _write_workers, _combined_format
+    if fmt is not None:
+        check_output_format(fmt)
+        _output_format = fmt
+    if workers is not None:
+        _write_workers = workers
+    if combined is not None:
+        if combined and combined not in ('parquet', 'csv'):
+            raise ValueError(f"Combined output must be parquet or csv, got {combined}")
+        if combined:
+            check_output_format(combined)
+        _combined_format = combined or None
+
+def _xlsx_engine():
+    """xlsxwriter, если установлен (пишет в разы быстрее openpyxl), иначе openpyxl."""
+    try:
+        import xlsxwriter  # noqa: F401
+        return 'xlsxwriter'
+    except ImportError:
+        return 'openpyxl'
+
+def _columnar(df):
+    """Колонки со смешанными типами (число и текст) приводятся к строкам: Parquet требует один тип."""
+    df = df.copy()
+    for column in df.columns:
+        if df[column].dtype == object:
+            types = {type(v) for v in df[column] if v is not None and v == v}
+            if len(types) > 1:
+                df[column] = [None if v is None or v != v else str(v) for v in df[column]]
+    return df
+
+def write_frame(df, path, fmt):
+    """Записывает DataFrame в файл выбранного формата; возвращает путь."""
+    if fmt == 'csv':
+        # utf-8-sig: Excel открывает кириллицу без выбора кодировки
+        df.to_csv(path, index=False, encoding='utf-8-sig')
+    elif fmt == 'parquet':
+        _columnar(df).to_parquet(path, index=False)
+    else:
+        df.to_excel(path, index=False, engine=_xlsx_engine())
+    return str(path)
 
 def read_excel(file_path, sheet_name=None):
+    import pandas as pd
     data = pd.read_excel(file_path, sheet_name=sheet_name)
     if isinstance(data, dict):  # если вернулся словарь, берём первый лист
         first_sheet = list(data.keys())[0]
@@ -13,19 +83,144 @@ def read_input_excel(file_path, sheet_name=None):
     return read_excel(file_path, sheet_name)
 
 
+@metrics.timed('write_output')
 def write_output_chunks(df, out_dir, base_name='output', chunk_size=5000):
+    """Пишет df частями по chunk_size строк (<base>_partN.<формат>), при больших объемах - в нескольких
+    процессах; с set_output(combined=...) дополнительно весь df одним файлом <base>.<формат>."""
     out_dir = Path(out_dir)
     out_dir.mkdir(parents=True, exist_ok=True)
     total = len(df)
     if total == 0:
         return []
+    fmt = _output_format
     parts = math.ceil(total / chunk_size)
-    paths = []
+    tasks = []
     for i in range(parts):
         start = i*chunk_size
         end = min(total, (i+1)*chunk_size)
-        chunk = df.iloc[start:end].copy()
-        path = out_dir / f"{base_name}_part{i+1}.xlsx"
-        chunk.to_excel(path, index=False)
-        paths.append(str(path))
-    return paths
\ No newline at end of file
+        tasks.append((df.iloc[start:end], out_dir / f"{base_name}_part{i+1}.{fmt}", fmt))
+    combined = (df, out_dir / f"{base_name}.{_combined_format}", _combined_format) if _combined_format else None
+    
+    # Параллельно пишутся только xlsx: csv и parquet записываются быстрее запуска процесса
+    workers = min(parts, _write_workers or os.cpu_count() or 1)
+    if fmt != 'xlsx' or workers <= 1 or total < PARALLEL_WRITE_ROWS:
+        paths = [write_frame(*task) for task in tasks]
+        return paths + [write_frame(*combined)] if combined else paths
+    # spawn: процессы записи не наследуют потоки и соединения родителя
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context) as executor:
+        futures = [executor.submit(write_frame, *task) for task in tasks]
+        # Общий файл пишется в текущем процессе, пока части пишут дочерние
+        extra = [write_frame(*combined)] if combined else []
+        return [future.result() for future in futures] + extra
+
+def read_output(path):
+    """Читает файл выхода любого формата (по расширению)."""
+    import pandas as pd
+    suffix = Path(path).suffix.lower()
+    if suffix == '.csv':
+        return pd.read_csv(path, encoding='utf-8-sig')
+    if suffix == '.parquet':
+        return pd.read_parquet(path)
+    return read_excel(path)
+
+def read_excel_columns(file_path, sheet_name=None):
+    """Заголовки листа без чтения данных (и без pandas) - для быстрой проверки колонок."""
+    wb = load_workbook(file_path, read_only=True, data_only=True)
+    try:
+        ws = wb[sheet_name] if sheet_name else wb.worksheets[0]
+        header = next(ws.iter_rows(max_row=1, values_only=True), ())
+    finally:
+        wb.close()
+    return [str(c) if c is not None else f"Unnamed: {i}" for i, c in enumerate(header)]
+
+def iter_excel_rows(file_path, sheet_name=None):
+    """Потоковое чтение листа через openpyxl read-only: (заголовки, генератор строк-кортежей).
+    Без sheet_name берется первый лист, как в read_excel."""
+    wb = load_workbook(file_path, read_only=True, data_only=True)
+    ws = wb[sheet_name] if sheet_name else wb.worksheets[0]
+    rows = ws.iter_rows(values_only=True)
+    try:
+        header = next(rows)
+    except StopIteration:
+        wb.close()
+        return [], iter(())
+    columns = [str(c) if c is not None else f"Unnamed: {i}" for i, c in enumerate(header)]
+
+    def generate():
+        try:
+            # Пустые строки в хвосте листа отбрасываем, как pandas; внутри данных - сохраняем
+            blank = 0
+            for row in rows:
+                if row is None or all(v is None for v in row):
+                    blank += 1
+                    continue
+                for _ in range(blank):
+                    yield tuple([None] * len(columns))
+                blank = 0
+                values = list(row[:len(columns)])
+                values += [None] * (len(columns) - len(values))
+                yield tuple(values)
+        finally:
+            wb.close()
+
+    return columns, generate()
+
+
+class ChunkedOutputWriter:
+    """Потоковая запись частями по chunk_size строк (<base>_partN.<формат>).
+    xlsx пишется в write-only книгу построчно, csv и parquet - буфером не больше одной части."""
+
+    def __init__(self, out_dir, columns, base_name='output', chunk_size=5000, fmt=None):
+        self.out_dir = Path(out_dir)
+        self.out_dir.mkdir(parents=True, exist_ok=True)
+        self.columns = list(columns)
+        self.base_name = base_name
+        self.chunk_size = chunk_size
+        self.fmt = fmt or _output_format
+        self.paths = []
+        self._wb = None
+        self._ws = None
+        self._buffer = None
+        self._rows = 0
+
+    def _open_part(self):
+        if self.fmt == 'xlsx':
+            self._wb = Workbook(write_only=True)
+            self._ws = self._wb.create_sheet()
+            self._ws.append(self.columns)
+        else:
+            self._buffer = []
+        self._rows = 0
+
+    def _save_part(self):
+        path = self.out_dir / f"{self.base_name}_part{len(self.paths) + 1}.{self.fmt}"
+        with metrics.timer('write_output'):
+            if self.fmt == 'xlsx':
+                self._wb.save(path)
+            else:
+                import pandas as pd
+                write_frame(pd.DataFrame(self._buffer, columns=self.columns), path, self.fmt)
+        self.paths.append(str(path))
+        self._wb = None
+        self._ws = None
+        self._buffer = None
+
+    def write_row(self, values):
+        if self._wb is None and self._buffer is None:
+            self._open_part()
+        if self._ws is not None:
+            self._ws.append(list(values))
+        else:
+            self._buffer.append(list(values))
+        self._rows += 1
+        if self._rows >= self.chunk_size:
+            self._save_part()
+
+    def close(self):
+        """Сохраняет последний неполный файл и возвращает пути всех частей."""
+        if (self._wb is not None or self._buffer is not None) and self._rows:
+            self._save_part()
+        self._wb = None
+        self._buffer = None
+        return self.paths
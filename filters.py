@@ -1,68 +1,109 @@
 import re
+from memo import memoize
 
+SPEC_KEYS = ('ram', 'storage', 'processor', 'graphics', 'screen_size', 'os')
+
+# Шаблоны характеристик в порядке приоритета внутри ключа:
+# (ключ, имя группы, шаблон, шаблон значения). Группы значения называются <имя>_<n>.
+# Шаблон значения None - берется все совпадение (как group(0)).
+_SPEC_PATTERNS = [
+    ('ram', 'ram', r'(?P<ram_1>\d+)\s*(?:GB|Gb|ГБ|Гб)', '{0}'),
+    ('storage', 'storage', r'(?:SSD|HDD)\s*(?P<storage_1>\d+)\s*(?:GB|Gb|ГБ|Гб|TB|Tb|ТБ|Тб)', '{0}'),
+    ('processor', 'core', r'(?i:Core i(?P<core_1>\d+)[- ](?P<core_2>\d+))', 'Intel Core i{0} {1}'),
+    ('processor', 'ryzen', r'(?i:Ryzen (?P<ryzen_1>\d+)[- ](?P<ryzen_2>\d+))', 'AMD Ryzen {0} {1}'),
+    ('processor', 'ultra', r'(?i:Core Ultra (?P<ultra_1>\d+)[- ](?P<ultra_2>\d+))', 'Intel Core Ultra {0} {1}'),
+    ('graphics', 'nvidia', r'(?i:(?:GeForce|NVIDIA)\s*(?:RTX|GTX)\s*(\d+))', None),
+    ('graphics', 'radeon', r'(?i:Radeon\s*(?:RX)?\s*(\d+))', None),
+    ('graphics', 'intel_gpu', r'(?i:Intel\s*(?:UHD|Iris)\s*(\d+)?)', None),
+    # Диагональ: двузначное число дюймов, кавычки " '' ″ ” (2.5"/3.5" - форм-фактор дисков, не экран)
+    ('screen_size', 'screen', r'(?<![\d.,])(?P<screen_1>[1-9]\d(?:[.,]\d{1,2})?)\s*(?:"|\'\'|″|”)', '{0}'),
+    ('os', 'windows', r'(?i:Windows\s*\d+(?:\s*(?:Home|Pro))?)', 'windows'),
+    ('os', 'no_os', r'(?i:Без ОС|Без операционн)', 'no_os'),
+    ('os', 'dos', r'(?i:DOS)', 'dos'),
+    ('os', 'linux', r'(?i:Linux)', 'linux'),
+]
+
+def _named(name, pattern):
+    """Оборачивает шаблон в именованную группу <name> для всего совпадения."""
+    return f"(?P<{name}>{pattern})"
+
+# Все шаблоны в одном выражении: lookahead дает совпадение в каждой позиции строки,
+# поэтому один проход finditer находит первое вхождение каждого шаблона, как отдельные re.search.
+# Первый lookahead - символы, с которых начинается хоть один шаблон: остальные позиции отсекаются сразу.
+_FIRST_CHARS = r'[\dSHCcRrGgNnIiWwБбDdLl]'
+_COMBINED = re.compile('(?=' + _FIRST_CHARS + ')(?=' + '|'.join(_named(name, pattern) for _, name, pattern, _ in _SPEC_PATTERNS) + ')')
+_TEMPLATES = {name: template for _, name, _, template in _SPEC_PATTERNS}
+_COMPILED = [(key, name, re.compile(_named(name, pattern)), template) for key, name, pattern, template in _SPEC_PATTERNS]
+_VALUE_GROUPS = {
+    name: sorted(g for g in compiled.groupindex if g.startswith(name + '_'))
+    for _, name, compiled, _ in _COMPILED
+}
+
+# Части названия поставщика, похожие на характеристики (объем памяти, процессор, видеокарта)
+SPEC_KEYWORDS = re.compile(r'gb|гб|tb|тб|core|ryzen|radeon|geforce|rtx|gtx')
+
+def is_spec_part(part):
+    """Есть ли в части названия ключевые слова характеристик."""
+    return SPEC_KEYWORDS.search(part.lower()) is not None
+
+def _format_value(name, template, match):
+    if template is None:
+        return match.group(name)
+    value = template.format(*(match.group(g) for g in _VALUE_GROUPS[name]))
+    if name == 'screen':
+        value = value.replace(',', '.')
+    return value
+
+@memoize('extract_specs', copy=dict)
 def extract_specs(query):
     """Извлекает характеристики из строки запроса"""
-    specs = {
-        'ram': None,
-        'storage': None,
-        'processor': None,
-        'graphics': None,
-        'screen_size': None,
-        'os': None
-    }
-    
-    # Извлечение RAM
-    ram_match = re.search(r'(\d+)\s*(?:GB|Gb|ГБ|Гб)', query)
-    if ram_match:
-        specs['ram'] = ram_match.group(1)
-    
-    # Извлечение storage
-    storage_match = re.search(r'(?:SSD|HDD)\s*(\d+)\s*(?:GB|Gb|ГБ|Гб|TB|Tb|ТБ|Тб)', query)
-    if storage_match:
-        specs['storage'] = storage_match.group(1)
-    
-    # Извлечение процессора
-    cpu_patterns = [
-        (r'Core i(\d+)[- ](\d+)', 'Intel Core i{0} {1}'),
-        (r'Ryzen (\d+)[- ](\d+)', 'AMD Ryzen {0} {1}'),
-        (r'Core Ultra (\d+)[- ](\d+)', 'Intel Core Ultra {0} {1}')
-    ]
-    
-    for pattern, template in cpu_patterns:
-        cpu_match = re.search(pattern, query, re.IGNORECASE)
-        if cpu_match:
-            specs['processor'] = template.format(*cpu_match.groups())
-            break
-    
-    # Извлечение видеокарты
-    gpu_patterns = [
-        r'(?:GeForce|NVIDIA)\s*(?:RTX|GTX)\s*(\d+)',
-        r'Radeon\s*(?:RX)?\s*(\d+)',
-        r'Intel\s*(?:UHD|Iris)\s*(\d+)?'
-    ]
-    
-    for pattern in gpu_patterns:
-        gpu_match = re.search(pattern, query, re.IGNORECASE)
-        if gpu_match:
-            specs['graphics'] = gpu_match.group(0)
-            break
-    
-    # Извлечение размера экрана
-    screen_match = re.search(r'(\d+\.?\d*)\s*[\'\"]\']', query)
-    if screen_match:
-        specs['screen_size'] = screen_match.group(1)
-    
-    # Определение ОС
-    os_patterns = {
-        'windows': r'Windows\s*\d+(?:\s*(?:Home|Pro))?',
-        'no_os': r'(?:Без ОС|Без операционн)',
-        'dos': r'DOS',
-        'linux': r'Linux'
-    }
-    
-    for os_name, pattern in os_patterns.items():
-        if re.search(pattern, query, re.IGNORECASE):
-            specs['os'] = os_name
-            break
-    
-    return specs
\ No newline at end of file
+    specs = dict.fromkeys(SPEC_KEYS)
+
+    # Первое вхождение каждого шаблона за один проход по строке
+    found = {}
+    for match in _COMBINED.finditer(query):
+        # В позиции совпадает не больше одного шаблона; его внешняя группа закрывается последней
+        name = match.lastgroup
+        if name not in found:
+            found[name] = _format_value(name, _TEMPLATES[name], match)
+
+    # Внутри ключа выигрывает шаблон с большим приоритетом
+    for key, name, _, _ in _SPEC_PATTERNS:
+        if specs[key] is None and name in found:
+            specs[key] = found[name]
+
+    return specs
+
+def _fill_template(template, groups, index):
+    """Подставляет колонки групп в шаблон значения; NaN там, где шаблон не совпал."""
+    import pandas as pd
+    pieces = re.split(r'\{(\d+)\}', template)
+    result = pd.Series(pieces[0], index=index, dtype=object)
+    for i in range(1, len(pieces), 2):
+        result = result + groups[int(pieces[i])].astype(object) + pieces[i + 1]
+    return result
+
+def extract_specs_batch(queries):
+    """Векторное извлечение характеристик для pandas Series строк.
+
+    Возвращает DataFrame с колонками SPEC_KEYS (индекс как у queries), значения как у extract_specs."""
+    # pandas нужен только пакетному пути: одиночный extract_specs работает без него
+    import pandas as pd
+    queries = pd.Series(queries).astype(str)
+    specs = pd.DataFrame(None, index=queries.index, columns=list(SPEC_KEYS), dtype=object)
+
+    for key, name, compiled, template in _COMPILED:
+        extracted = queries.str.extract(compiled)
+        matched = extracted[name].notna()
+        if template is None:
+            values = extracted[name].astype(object)
+        elif _VALUE_GROUPS[name]:
+            values = _fill_template(template, [extracted[g] for g in _VALUE_GROUPS[name]], queries.index)
+            if name == 'screen':
+                values = values.str.replace(',', '.', regex=False)
+        else:
+            values = pd.Series(template, index=queries.index, dtype=object)
+        # Приоритет: значение более раннего шаблона ключа не перезаписывается
+        specs[key] = specs[key].where(specs[key].notna(), values.where(matched))
+
+    return specs.astype(object).where(specs.notna(), None)
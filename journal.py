@@ -0,0 +1,94 @@
+import glob
+import json
+import logging
+import os
+import threading
+import time
+
+def journal_path(out_dir, base_name):
+    """Путь к журналу строк для входного файла."""
+    return os.path.join(out_dir, f"{base_name}.journal.jsonl")
+
+def shard_journal_path(out_dir, base_name, shard):
+    """Путь к журналу шарда при запуске с --shards."""
+    return journal_path(out_dir, f"{base_name}.shard{shard}")
+
+def shard_journal_paths(out_dir, base_name):
+    """Все журналы шардов входного файла, оставшиеся от прошлых запусков."""
+    pattern = os.path.join(glob.escape(out_dir), f"{glob.escape(base_name)}.shard*.journal.jsonl")
+    return sorted(glob.glob(pattern))
+
+def discard_shard_journals(out_dir, base_name):
+    """Удаляет журналы шардов прошлых запусков: новый запуск без продолжения не должен
+    получить их строки при следующем --resume (они перекрывают обычный журнал)."""
+    for path in shard_journal_paths(out_dir, base_name):
+        os.remove(path)
+
+class RowJournal:
+    """Append-only журнал обработанных строк (JSON Lines), сбрасывается на диск после каждой строки."""
+
+    def __init__(self, path, append=True):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self._lock = threading.Lock()
+        self._file = open(path, 'a' if append else 'w', encoding='utf-8')
+
+    def record(self, row_index, result):
+        """Записывает результат строки: индекс, запрос, выбранный товар, score, статус и время поиска.
+        Строки с ошибкой (error) записываются с текстом ошибки, при продолжении они ищутся заново.
+        duplicate - строка получила результат поиска более ранней строки с тем же запросом."""
+        entry = {
+            'row': int(row_index),
+            'query': result.get('query'),
+            'best_id': result.get('best_id'),
+            'best_title': result.get('best_title'),
+            'best_price': result.get('best_price'),
+            'score': result.get('score'),
+            'url': result.get('url'),
+            'status': result.get('status'),
+            'fetches': result.get('fetches'),
+            'elapsed': result.get('elapsed'),
+            'error': result.get('error'),
+            'duplicate': bool(result.get('duplicate')),
+            'ts': time.time(),
+        }
+        line = json.dumps(entry, ensure_ascii=False, default=str)
+        with self._lock:
+            self._file.write(line + '\n')
+            self._file.flush()
+            os.fsync(self._file.fileno())
+
+    def close(self):
+        with self._lock:
+            if not self._file.closed:
+                self._file.close()
+
+def load_journal(path):
+    """Читает журнал: {индекс строки: результат}. Оборванная последняя строка пропускается."""
+    done = {}
+    if not os.path.exists(path):
+        return done
+    with open(path, encoding='utf-8') as f:
+        for line_no, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                logging.warning(f"Skipping corrupted journal line {line_no} in {path}")
+                continue
+            row = entry.pop('row')
+            entry.pop('ts', None)
+            done[row] = entry
+    return done
+
+def load_journals(out_dir, base_name):
+    """Объединяет журнал обычного запуска и журналы шардов: индексы строк в них абсолютные,
+    поэтому продолжать можно с любым числом шардов."""
+    done = {}
+    for path in [journal_path(out_dir, base_name)] + shard_journal_paths(out_dir, base_name):
+        done.update(load_journal(path))
+    return done
@@ -1,199 +1,654 @@
-import requests
-from urllib.parse import quote
+from urllib.parse import quote, urlsplit
 import re
 import time
 import logging
-from selenium import webdriver
-from selenium.webdriver.chrome.options import Options
-from selenium.webdriver.chrome.service import Service
-from webdriver_manager.chrome import ChromeDriverManager
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
+import os
+import queue
+import threading
+from contextlib import contextmanager
 import json
-from bs4 import BeautifulSoup
-from config import PROXIES, TIMEOUT, MIN_DELAY, MAX_DELAY
-from kaspi_filters import apply_filters
-
-# Глобальный драйвер для повторного использования
-driver = None
-
-def init_driver():
-    """Инициализация headless Chrome браузера."""
-    global driver
-    if driver is None:
-        options = Options()
-        options.add_argument("--headless")
-        options.add_argument("--disable-gpu")
-        options.add_argument("--no-sandbox")
-        options.add_argument("--window-size=1920,1080")
-        options.add_argument("--disable-dev-shm-usage")
-        service = Service(ChromeDriverManager().install())
-        driver = webdriver.Chrome(service=service, options=options)
+from config import TIMEOUT, MAX_WORKERS, FETCH_MODE, FILTER_MODE, KASPI_BASE_URL, LEAN_BROWSER, DRIVER_MAX_PAGES, DRIVER_MAX_RSS_MB, CHROMEDRIVER_PATH, DRIVER_PATH_CACHE
+from kaspi_filters import apply_filters, filter_url, page_facets
+from page_ready import wait_results_ready
+from proxy_pool import get_scheduler, retry_after_seconds
+import startup
+import metrics
+
+# Что не нужно для выдачи: картинки, видео, шрифты и сторонние счетчики/реклама.
+# CSS не блокируем: без стилей фильтры в боковой панели становятся некликабельными.
+BLOCKED_URLS = [
+    '*.png', '*.jpg', '*.jpeg', '*.gif', '*.webp', '*.avif', '*.svg', '*.ico',
+    '*.mp4', '*.webm', '*.m3u8', '*.woff', '*.woff2', '*.ttf', '*.otf', '*.eot',
+    '*google-analytics.com*', '*googletagmanager.com*', '*doubleclick.net*',
+    '*mc.yandex.ru*', '*yandex.ru/metrika*', '*facebook.net*', '*connect.facebook.*',
+    '*analytics.tiktok.com*', '*top-fwz1.mail.ru*', '*hotjar.com*', '*criteo.*',
+]
+# RSS браузера проверяется раз в столько поисков (обход процессов Chrome не бесплатный)
+RSS_CHECK_EVERY = 10
+
+def _chrome_proxy(proxy):
+    """Адрес прокси для --proxy-server: Chrome не принимает логин и пароль в аргументе."""
+    parts = urlsplit(proxy if '://' in proxy else f"http://{proxy}")
+    if parts.username:
+        logging.warning(f"Chrome ignores credentials of proxy {parts.hostname}:{parts.port}")
+    return f"{parts.scheme}://{parts.hostname}:{parts.port}" if parts.port else f"{parts.scheme}://{parts.hostname}"
+
+# Selenium, webdriver_manager, BeautifulSoup и lxml загружаются при первом использовании:
+# поиск через HTTP по __NEXT_DATA__ без них обходится, а импорт занимает сотни миллисекунд.
+
+def _cached_driver_path():
+    try:
+        with open(DRIVER_PATH_CACHE, encoding='utf-8') as f:
+            path = f.read().strip()
+    except OSError:
+        return None
+    return path if path and os.access(path, os.X_OK) else None
+
+def chromedriver_path(refresh=False):
+    """Путь к chromedriver: CHROMEDRIVER_PATH, иначе сохраненный в DRIVER_PATH_CACHE,
+    иначе ChromeDriverManager (может идти в сеть) с сохранением результата."""
+    if CHROMEDRIVER_PATH:
+        return CHROMEDRIVER_PATH
+    path = None if refresh else _cached_driver_path()
+    if path:
+        return path
+    from webdriver_manager.chrome import ChromeDriverManager
+    with startup.timed('chromedriver.install'):
+        path = ChromeDriverManager().install()
+    directory = os.path.dirname(DRIVER_PATH_CACHE)
+    try:
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(DRIVER_PATH_CACHE, 'w', encoding='utf-8') as f:
+            f.write(path)
+    except OSError as e:
+        logging.warning(f"Could not cache chromedriver path: {e}")
+    return path
+
+@metrics.timed('driver.init')
+def init_driver(proxy=None):
+    """Создание нового headless Chrome браузера (весь трафик идет через proxy, если задан)."""
+    from selenium import webdriver
+    from selenium.webdriver.chrome.options import Options
+    from selenium.webdriver.chrome.service import Service
+    from selenium.common.exceptions import WebDriverException, SessionNotCreatedException
+    options = Options()
+    options.add_argument("--headless")
+    options.add_argument("--disable-gpu")
+    options.add_argument("--no-sandbox")
+    options.add_argument("--window-size=1920,1080")
+    options.add_argument("--disable-dev-shm-usage")
+    if proxy:
+        options.add_argument(f"--proxy-server={_chrome_proxy(proxy)}")
+    if LEAN_BROWSER:
+        # driver.get возвращается после DOMContentLoaded; готовность выдачи определяет page_ready
+        options.page_load_strategy = 'eager'
+        options.add_argument("--blink-settings=imagesEnabled=false")
+        options.add_experimental_option('prefs', {'profile.managed_default_content_settings.images': 2})
+    # CDP-события сети нужны page_ready для определения простоя сети
+    options.set_capability('goog:loggingPrefs', {'performance': 'ALL'})
+    with startup.timed('driver.launch'):
+        try:
+            driver = webdriver.Chrome(service=Service(chromedriver_path()), options=options)
+        except SessionNotCreatedException:
+            if CHROMEDRIVER_PATH:
+                raise
+            # Chrome обновился, а сохраненный chromedriver - старой версии
+            logging.info("Cached chromedriver rejected by Chrome, resolving it again")
+            driver = webdriver.Chrome(service=Service(chromedriver_path(refresh=True)), options=options)
+    if LEAN_BROWSER:
+        try:
+            driver.execute_cdp_cmd('Network.enable', {})
+            driver.execute_cdp_cmd('Network.setBlockedURLs', {'urls': BLOCKED_URLS})
+        except WebDriverException as e:
+            logging.warning(f"Could not block resources in browser: {e}")
     return driver
 
+def browser_rss_mb(driver):
+    """Память браузера (chromedriver и все процессы Chrome), МБ; None без psutil."""
+    try:
+        import psutil
+    except ImportError:  # psutil необязателен: без него браузеры перезапускаются только по числу страниц
+        return None
+    try:
+        root = psutil.Process(driver.service.process.pid)
+        processes = [root] + root.children(recursive=True)
+    except (AttributeError, psutil.Error):
+        return None
+    total = 0
+    for process in processes:
+        try:
+            total += process.memory_info().rss
+        except psutil.Error:
+            continue
+    return total / (1024 * 1024)
+
+class DriverPool:
+    """Пул браузеров: драйвер берется на время одного поиска и возвращается обратно.
+    Каждый браузер привязан к прокси планировщика (атрибут kaspi_proxy) и перезапускается
+    после max_pages поисков или при превышении max_rss_mb."""
+
+    def __init__(self, size=MAX_WORKERS, max_pages=DRIVER_MAX_PAGES, max_rss_mb=DRIVER_MAX_RSS_MB):
+        self.size = max(1, int(size))
+        self.max_pages = max_pages
+        self.max_rss_mb = max_rss_mb
+        self._idle = queue.LifoQueue()
+        self._drivers = []
+        self._lock = threading.Lock()
+
+    def checkout(self, timeout=None):
+        """Выдает свободный драйвер, при необходимости запуская новый (не больше size).
+        None в очереди - место закрытого браузера освободилось, можно запустить новый."""
+        try:
+            driver = self._idle.get_nowait()
+            if driver is not None:
+                return driver
+        except queue.Empty:
+            pass
+
+        with self._lock:
+            can_create = len(self._drivers) < self.size
+            if can_create:
+                # Резервируем место, чтобы параллельные потоки не превысили размер пула
+                self._drivers.append(None)
+
+        if not can_create:
+            driver = self._idle.get(timeout=timeout)
+            return driver if driver is not None else self.checkout(timeout)
+
+        proxy = get_scheduler().assign()
+        try:
+            driver = init_driver(proxy)
+        except Exception:
+            with self._lock:
+                self._drivers.remove(None)
+            raise
+        driver.kaspi_proxy = proxy
+        driver.kaspi_pages = 0
+        with self._lock:
+            self._drivers[self._drivers.index(None)] = driver
+        logging.info(f"Started browser {len(self._drivers)}/{self.size}")
+        return driver
+
+    def checkin(self, driver, broken=False):
+        """Возвращает драйвер в пул; сломанный драйвер закрывается и освобождает место.
+        Браузер с исключенным прокси тоже закрывается, новый получит здоровый прокси."""
+        if not broken and get_scheduler().is_ejected(getattr(driver, 'kaspi_proxy', None)):
+            broken = True
+        if not broken and self._worn_out(driver):
+            metrics.count('driver.recycled')
+            broken = True
+        if not broken:
+            self._idle.put(driver)
+            return
+        with self._lock:
+            if driver in self._drivers:
+                self._drivers.remove(driver)
+        try:
+            driver.quit()
+        except Exception:
+            pass
+        # Будим поток, ждущий браузер: он запустит новый на освободившемся месте
+        self._idle.put(None)
+
+    def _worn_out(self, driver):
+        """Браузер отработал свой лимит страниц или разросся по памяти."""
+        driver.kaspi_pages = getattr(driver, 'kaspi_pages', 0) + 1
+        if self.max_pages and driver.kaspi_pages >= self.max_pages:
+            logging.info(f"Recycling browser after {driver.kaspi_pages} pages")
+            return True
+        if self.max_rss_mb and driver.kaspi_pages % RSS_CHECK_EVERY == 0:
+            rss = browser_rss_mb(driver)
+            if rss is not None and rss > self.max_rss_mb:
+                logging.info(f"Recycling browser using {rss:.0f} MB after {driver.kaspi_pages} pages")
+                return True
+        return False
+
+    @contextmanager
+    def driver(self):
+        from selenium.common.exceptions import WebDriverException
+        driver = self.checkout()
+        broken = False
+        try:
+            yield driver
+        except WebDriverException:
+            broken = True
+            raise
+        finally:
+            self.checkin(driver, broken=broken)
+
+    def close(self):
+        with self._lock:
+            drivers = [d for d in self._drivers if d is not None]
+            self._drivers = []
+        while not self._idle.empty():
+            self._idle.get_nowait()
+        for driver in drivers:
+            try:
+                driver.quit()
+            except Exception:
+                pass
+
+# Глобальный пул драйверов для повторного использования
+_pool = None
+_pool_lock = threading.Lock()
+
+def get_pool(size=None):
+    """Возвращает глобальный пул; при смене размера старый пул закрывается."""
+    global _pool
+    with _pool_lock:
+        if _pool is None or (size is not None and _pool.size != max(1, int(size))):
+            if _pool is not None:
+                _pool.close()
+            _pool = DriverPool(size if size is not None else MAX_WORKERS)
+        return _pool
+
 def close_driver():
-    """Закрытие браузера."""
-    global driver
-    if driver:
-        driver.quit()
-        driver = None
+    """Закрытие всех браузеров пула."""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.close()
+            _pool = None
+
+_base_url = KASPI_BASE_URL
+
+def set_base_url(url):
+    """Адрес сайта для страниц поиска (например, локальный стенд бенчмарка)."""
+    global _base_url
+    _base_url = url.rstrip('/')
+
+def search_url(query):
+    """URL страницы поиска Kaspi для запроса."""
+    encoded = quote(query, safe='')
+    return f"{_base_url}/shop/search/?text={encoded}"
 
+def product_url(product_id):
+    """URL страницы товара Kaspi по его коду."""
+    return f"{_base_url}/shop/p/{quote(str(product_id), safe='')}/"
+
+@metrics.timed('browser.scrape')
 def scrape_kaspi(query: str, specs=None) -> str:
     """Получение HTML страницы с результатами поиска Kaspi."""
-    driver = init_driver()
-    encoded = quote(query, safe='')
-    url = f"https://kaspi.kz/shop/search/?text={encoded}"
-    
+    from selenium.common.exceptions import WebDriverException
+    url = search_url(query)
+
+    with get_pool().driver() as driver:
+        proxy = getattr(driver, 'kaspi_proxy', None)
+        scheduler = get_scheduler()
+        scheduler.acquire_proxy(proxy, slot=id(driver))
+        started = time.perf_counter()
+        try:
+            html = _load_search_page(driver, url, specs)
+        except WebDriverException:
+            scheduler.release(proxy, False, time.perf_counter() - started)
+            raise
+        scheduler.release(proxy, True, time.perf_counter() - started)
+        return html
+
+def _load_search_page(driver, url, specs=None):
+    """Загрузка страницы поиска в выданном из пула драйвере."""
     logging.info(f"Fetching URL: {url}")
     driver.get(url)
-    
-    # Закрыть баннер с куками если есть
-    try:
-        cookie_btn = WebDriverWait(driver, 5).until(
-            EC.element_to_be_clickable((By.CSS_SELECTOR, 'button[data-test-id="cookie-banner-accept-button"]'))
-        )
-        cookie_btn.click()
-    except Exception:
-        pass
+    wait_results_ready(driver, step='page_load')
+    _accept_cookies(driver)
         
-    # Применяем фильтры если они есть
+    # Применяем фильтры если они есть: одной навигацией по фасетам страницы, иначе кликами
     if specs:
-        apply_filters(driver, specs)
+        filtered = page_filter_url(url, specs, driver.page_source)
+        if filtered:
+            logging.info(f"Fetching URL: {filtered}")
+            driver.get(filtered)
+            if not wait_results_ready(driver, step='filtered_load'):
+                logging.info("URL filters returned no products, using unfiltered results")
+                driver.get(url)
+                wait_results_ready(driver, step='page_load')
+        else:
+            apply_filters(driver, specs)
 
-    # Прокрутка для загрузки товаров
+    # Прокрутка для загрузки товаров, ждем пока догрузятся карточки
     driver.execute_script("window.scrollTo(0, document.body.scrollHeight);")
-    time.sleep(1)  # Ждем загрузку
-
-    # Дополнительное ожидание для JS-рендеринга
-    time.sleep(2)
+    wait_results_ready(driver, step='scroll')
     
     return driver.page_source
 
-def parse_products(html: str, limit=20):
-    """Парсинг результатов поиска и возврат списка товаров."""
+def _accept_cookies(driver):
+    """Закрыть баннер с куками если есть (к этому моменту он уже отрисован)."""
+    from selenium.webdriver.common.by import By
+    try:
+        cookie_btns = driver.find_elements(By.CSS_SELECTOR, 'button[data-test-id="cookie-banner-accept-button"]')
+        if cookie_btns:
+            cookie_btns[0].click()
+    except Exception:
+        pass
+
+# HTTP-сессии: по одной на поток, соединения держатся открытыми (keep-alive)
+_sessions = threading.local()
+_fetch_mode = FETCH_MODE
+
+def set_fetch_mode(mode):
+    """Выбор способа загрузки: 'http' (с откатом на браузер) или 'browser'."""
+    global _fetch_mode
+    if mode not in ('http', 'browser'):
+        raise ValueError(f"Unknown fetch mode: {mode}")
+    _fetch_mode = mode
+
+def get_session():
+    """HTTP-сессия текущего потока с пулом keep-alive соединений."""
+    session = getattr(_sessions, 'session', None)
+    if session is None:
+        # requests и user_agent загружаются при первом запросе, а не при старте
+        import requests
+        from requests.adapters import HTTPAdapter
+        from user_agent import generate_user_agent
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=MAX_WORKERS, pool_maxsize=MAX_WORKERS, max_retries=1)
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        session.headers.update({
+            'User-Agent': generate_user_agent(device_type='desktop'),
+            'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8',
+            'Accept-Language': 'ru-RU,ru;q=0.9',
+        })
+        _sessions.session = session
+    return session
+
+@metrics.timed('http.fetch')
+def fetch_html(url, proxy=None):
+    """Загрузка страницы обычным HTTP-запросом, без браузера.
+    Без явного proxy прокси выбирает планировщик, с учетом лимитов и здоровья."""
+    import requests
+    scheduler = get_scheduler()
+    proxy = scheduler.acquire() if proxy is None else scheduler.acquire_proxy(proxy)
+    proxies = {'http': proxy, 'https': proxy} if proxy else None
+    logging.info(f"Fetching URL (http): {url}")
+    started = time.perf_counter()
+    try:
+        response = get_session().get(url, proxies=proxies, timeout=TIMEOUT)
+    except requests.RequestException:
+        scheduler.release(proxy, False, time.perf_counter() - started)
+        raise
+    latency = time.perf_counter() - started
+    if response.status_code == 429:
+        # Ограничение частоты - не сбой прокси: пауза по Retry-After
+        scheduler.release(proxy, False, latency, retry_after=retry_after_seconds(response.headers.get('Retry-After')))
+    else:
+        # 404/410 - ответ сайта об удаленной странице, а не сбой прокси
+        scheduler.release(proxy, response.ok or response.status_code in (404, 410), latency)
+    response.raise_for_status()
+    return response.text
+
+_NEXT_DATA_RE = re.compile(r'<script id="__NEXT_DATA__" type="application/json">(.*?)</script>', re.S)
+
+def page_filter_url(url, specs, html):
+    """URL выдачи с фильтрами specs по фасетам из __NEXT_DATA__ страницы html (она же выдача url без фильтров).
+    None - фильтровать нечем, на странице нет нужных фасетов или FILTER_MODE = "click"."""
+    if not specs or FILTER_MODE != 'url' or not html:
+        return None
+    match = _NEXT_DATA_RE.search(html)
+    if not match:
+        return None
+    try:
+        data = json.loads(match.group(1))
+    except ValueError:
+        return None
+    return filter_url(url, specs, page_facets(data))
+
+def parse_next_data(html: str, limit=20):
+    """Товары из JSON-блока __NEXT_DATA__; None, если блока на странице нет или он не разбирается."""
+    match = _NEXT_DATA_RE.search(html)
+    if not match:
+        return None
     products = []
-    soup = BeautifulSoup(html, "html.parser")
-    
-    # Попытка извлечь данные из Next.js JSON
-    match = re.search(r'<script id="__NEXT_DATA__" type="application/json">(.*?)</script>', html, re.S)
-    if match:
+    try:
+        data = json.loads(match.group(1))
+        items = (data.get('props', {})
+                    .get('pageProps', {})
+                    .get('initialData', {})
+                    .get('data', {})
+                    .get('products', []))
+        for item in items:
+            title = item.get('name')
+            # Проверяем категорию товара если она есть
+            category = item.get('category', {}).get('name', '').lower()
+            subcategory = item.get('category', {}).get('parentCategory', {}).get('name', '').lower()
+            
+            # Если есть название товара и категория подходящая
+            if title and category:
+                products.append({
+                    'id': str(item.get('id')),
+                    'title': title,
+                    'price': item.get('price'),
+                    'url': f"https://kaspi.kz/shop/p/{item.get('id')}/",
+                    'category': category,
+                    'subcategory': subcategory
+                })
+                
+        # Сортируем по релевантности (наименование -> цена)
+        products = sorted(products[:limit], key=lambda x: (-1 if x.get('category', '').lower() == 'water heaters' else 0, x.get('price', 0) or 0))
+        return products[:limit]
+    except Exception as e:
+        logging.warning(f"JSON parse error: {e}")
+        return None
+
+# Карточки товаров в выдаче: div.item-card, ссылка с названием и цена без рассрочки
+_CARD_XPATH = "//div[contains(concat(' ', normalize-space(@class), ' '), ' item-card ')]"
+_LINK_XPATH = ".//a[contains(concat(' ', normalize-space(@class), ' '), ' item-card__name-link ')]"
+_PRICE_XPATH = ".//span[contains(concat(' ', normalize-space(@class), ' '), ' item-card__prices-price ')]"
+_PRODUCT_ID_RE = re.compile(r'(\d+)/?(?:[?#].*)?$')
+
+def _card_product(product_id, href, title, price_text):
+    """Товар из полей карточки; None, если карточка неполная."""
+    if not href or not title:
+        return None
+    link = href if href.startswith('http') else 'https://kaspi.kz' + href
+    if not product_id:
+        match = _PRODUCT_ID_RE.search(link)
+        product_id = match.group(1) if match else link.rstrip('/').split('/')[-1]
+    price = None
+    if price_text:
+        digits = ''.join(filter(str.isdigit, price_text))
+        price = int(digits) if digits else None
+    return {
+        'id': product_id,
+        'title': title.strip(),
+        'price': price,
+        'url': link
+    }
+
+def lxml_available():
+    """Установлен ли lxml (модуль загружается при первом разборе карточек)."""
+    global _lxml_html
+    if _lxml_html is False:
+        try:
+            from lxml import html as lxml_html
+        except ImportError:  # lxml необязателен: без него карточки разбирает html.parser
+            lxml_html = None
+        _lxml_html = lxml_html
+    return _lxml_html is not None
+
+# lxml.html; False - еще не загружался, None - не установлен
+_lxml_html = False
+
+def _parse_cards_lxml(html):
+    lxml_available()
+    tree = _lxml_html.fromstring(html)
+    for card in tree.xpath(_CARD_XPATH):
+        links = card.xpath(_LINK_XPATH)
+        if not links:
+            continue
+        prices = card.xpath(_PRICE_XPATH)
+        yield (card.get('data-product-id'), links[0].get('href'), links[0].text_content(),
+               prices[0].text_content() if prices else None)
+
+def _parse_cards_soup(html):
+    # Строится дерево только из карточек, остальная страница пропускается
+    # (class на этапе фильтрации еще не разбит на список, поэтому проверка через split)
+    from bs4 import BeautifulSoup, SoupStrainer
+    strainer = SoupStrainer('div', class_=lambda c: c is not None and 'item-card' in c.split())
+    soup = BeautifulSoup(html, 'html.parser', parse_only=strainer)
+    for card in soup.find_all('div', class_='item-card'):
+        link = card.select_one('a.item-card__name-link')
+        if not link:
+            continue
+        price = card.select_one('span.item-card__prices-price')
+        yield (card.get('data-product-id'), link.get('href'), link.get_text(),
+               price.get_text() if price else None)
+
+def parse_cards(html: str, limit=None):
+    """Разбор карточек товаров из HTML за один проход (lxml, если установлен)."""
+    if not html or not html.strip():
+        return []
+    parser = _parse_cards_lxml if lxml_available() else _parse_cards_soup
+    products = []
+    for fields in parser(html):
         try:
-            data = json.loads(match.group(1))
-            items = (data.get('props', {})
-                        .get('pageProps', {})
-                        .get('initialData', {})
-                        .get('data', {})
-                        .get('products', []))
-            if items:
-                for item in items:
-                    title = item.get('name')
-                    # Проверяем категорию товара если она есть
-                    category = item.get('category', {}).get('name', '').lower()
-                    subcategory = item.get('category', {}).get('parentCategory', {}).get('name', '').lower()
-                    
-                    # Если есть название товара и категория подходящая
-                    if title and category:
-                        products.append({
-                            'id': str(item.get('id')),
-                            'title': title,
-                            'price': item.get('price'),
-                            'url': f"https://kaspi.kz/shop/p/{item.get('id')}/",
-                            'category': category,
-                            'subcategory': subcategory
-                        })
-                        
-                # Сортируем по релевантности (наименование -> цена)
-                products = sorted(products[:limit], key=lambda x: (-1 if x.get('category', '').lower() == 'water heaters' else 0, x.get('price', 0) or 0))
-                return products[:limit]
+            product = _card_product(*fields)
         except Exception as e:
-            logging.warning(f"JSON parse error: {e}")
+            logging.warning(f"Error parsing card: {e}")
+            continue
+        if product:
+            products.append(product)
+            if limit and len(products) >= limit:
+                break
+    return products
 
-    # Запасной вариант - парсинг HTML
-    cards = soup.find_all("div", attrs={"data-product-id": True})
-    for card in cards:
-        prod_id = card.get("data-product-id")
-        
-        # Название товара
-        title_tag = card.find("div", class_=lambda c: c and "item-card__name" in c)
-        title = title_tag.get_text().strip() if title_tag else None
-        
-        # Цена (без рассрочки)
-        price_tag = card.find("div", class_=lambda c: c and "item-card__price" in c and "item-card__transfer" not in c)
-        price = None
-        if price_tag:
-            txt = price_tag.get_text()
-            m = re.search(r'([\d\s]+)\s*₸', txt)
-            if m:
-                price = int(m.group(1).replace(' ', ''))
-        
-        # Категория товара
-        category_tag = card.find("span", class_=lambda c: c and "item-card__category" in c)
-        category = category_tag.get_text().strip().lower() if category_tag else ""
-        
-        if prod_id and title and price:
-            products.append({
-                'id': prod_id,
-                'title': title,
+@metrics.timed('parse')
+def extract_products(html: str, limit=None):
+    """Товары со страницы поиска: сначала JSON __NEXT_DATA__ без построения дерева, затем карточки."""
+    products = parse_next_data(html, limit or 20)
+    if products:
+        return products
+    return parse_cards(html, limit)
+
+def parse_products(html: str, limit=20):
+    """Парсинг результатов поиска и возврат списка товаров."""
+    return extract_products(html, limit)
+
+_LD_JSON_RE = re.compile(r'<script[^>]*type="application/ld\+json"[^>]*>(.*?)</script>', re.S)
+_META_PRICE_RE = re.compile(r'<meta[^>]*itemprop="price"[^>]*content="([\d.]+)"')
+
+def _price_value(value):
+    try:
+        return float(str(value).replace(' ', '').replace(',', '.'))
+    except (TypeError, ValueError):
+        return None
+
+def parse_product_page(html, product_id=None):
+    """Товар со страницы карточки: JSON-LD Product (название, цена, наличие), затем meta itemprop=price.
+    None, если цены на странице нет."""
+    for blob in _LD_JSON_RE.findall(html):
+        try:
+            data = json.loads(blob)
+        except ValueError:
+            continue
+        for item in data if isinstance(data, list) else [data]:
+            if not isinstance(item, dict) or item.get('@type') != 'Product':
+                continue
+            offers = item.get('offers') or {}
+            if isinstance(offers, list):
+                offers = offers[0] if offers else {}
+            price = _price_value(offers.get('price', offers.get('lowPrice')))
+            if price is None:
+                continue
+            return {
+                'id': str(product_id) if product_id is not None else str(item.get('sku') or ''),
+                'title': item.get('name'),
                 'price': price,
-                'url': f"https://kaspi.kz/shop/p/{prod_id}/",
-                'category': category
-            })
-    
-    # Сортируем по релевантности
-    products = sorted(products[:limit], key=lambda x: (-1 if 'водонагреватель' in x.get('title', '').lower() else 0, x.get('price', 0) or 0))
-    return products[:limit]
+                'url': f"https://kaspi.kz/shop/p/{product_id}/",
+                'available': 'OutOfStock' not in str(offers.get('availability', '')),
+            }
+    match = _META_PRICE_RE.search(html)
+    if match and _price_value(match.group(1)) is not None:
+        return {'id': str(product_id), 'title': None, 'price': _price_value(match.group(1)),
+                'url': f"https://kaspi.kz/shop/p/{product_id}/", 'available': True}
+    return None
+
+def fetch_product(product_id, proxy=None):
+    """Актуальные данные товара по коду Kaspi (HTTP, без браузера).
+    None - товар исчез (404), снят с продажи или цены на странице нет."""
+    import requests
+    try:
+        html = fetch_html(product_url(product_id), proxy=proxy)
+    except requests.HTTPError as e:
+        if e.response is not None and e.response.status_code in (404, 410):
+            return None
+        raise
+    product = parse_product_page(html, product_id)
+    if product is None or not product['available']:
+        return None
+    return product
 
 def fetch_search_results(query, proxy=None, specs=None):
     """Основная функция поиска товаров на Kaspi."""
+    import requests
+    if _fetch_mode == 'http':
+        metrics.count('fetch.http')
+        try:
+            products = _fetch_with_http(query, proxy=proxy, specs=specs)
+            if products is not None:
+                return products
+            logging.info(f"No __NEXT_DATA__ for '{query}', falling back to browser")
+        except requests.RequestException as e:
+            logging.warning(f"HTTP fetch failed for '{query}': {e}, falling back to browser")
+    metrics.count('fetch.browser')
+    return _fetch_with_browser(query, specs=specs)
+
+def fetch_mode():
+    return _fetch_mode
+
+def fetch_search_page(query, specs=None, mode=None):
+    """HTML страницы поиска без разбора (стадия загрузки конвейера).
+    mode - 'http' или 'browser', по умолчанию текущий режим загрузки."""
+    if (mode or _fetch_mode) == 'http':
+        metrics.count('fetch.http')
+        return _search_html(search_url(query), specs)
+    metrics.count('fetch.browser')
+    return scrape_kaspi(query, specs=specs)
+
+def parse_search_page(html, mode=None):
+    """Товары из HTML fetch_search_page. В режиме http - только из __NEXT_DATA__
+    (None - блока нет, нужен браузер), в браузере - и из карточек."""
+    if (mode or _fetch_mode) == 'http':
+        with metrics.timer('parse'):
+            return parse_next_data(html)
+    return extract_products(html) if html else []
+
+def _search_html(url, specs=None, proxy=None):
+    """HTML выдачи без браузера. С specs после выдачи без фильтров загружается отфильтрованная
+    по фасетам этой страницы; если она пустая, остается выдача без фильтров."""
+    html = fetch_html(url, proxy=proxy)
+    filtered = page_filter_url(url, specs, html)
+    if filtered:
+        filtered_html = fetch_html(filtered, proxy=proxy)
+        if parse_next_data(filtered_html):
+            return filtered_html
+        logging.info("URL filters returned no products, using unfiltered results")
+    return html
+
+def _fetch_with_http(query, proxy=None, specs=None):
+    """Поиск без браузера. None - на странице нет __NEXT_DATA__, нужен браузер."""
+    html = _search_html(search_url(query), specs, proxy=proxy)
+    with metrics.timer('parse'):
+        return parse_next_data(html)
+
+def _fetch_with_browser(query, specs=None):
+    """Поиск через Selenium: полный рендер страницы и разбор карточек.
+    Сбой браузера пробрасывается: строка должна стать ошибкой поиска, а не "не найден"."""
     try:
         html = scrape_kaspi(query, specs=specs)
         if not html:
             logging.warning(f"No HTML content received for query: {query}")
             return []
             
-        soup = BeautifulSoup(html, 'html.parser')
-        items = []
-        
-        for card in soup.select('div.item-card'):
-            try:
-                # Ссылка и ID
-                link_elem = card.select_one('a.item-card__name-link')
-                if not link_elem:
-                    continue
-                
-                link = 'https://kaspi.kz' + link_elem['href']
-                item_id = link.split('/')[-1]
-                
-                # Название
-                title = link_elem.text.strip()
-                
-                # Цена
-                price_elem = card.select_one('span.item-card__prices-price')
-                price = None
-                if price_elem:
-                    price_text = price_elem.text.strip()
-                    price = int(''.join(filter(str.isdigit, price_text)))
-                
-                item = {
-                    'id': item_id,
-                    'title': title,
-                    'price': price,
-                    'url': link
-                }
-                items.append(item)
-                
-            except Exception as e:
-                logging.warning(f"Error parsing card: {e}")
-                continue
-                
+        items = extract_products(html)
         if not items:
             logging.warning(f"No products found for query: {query}")
         return items
         
     except Exception as e:
         logging.error(f"Error fetching results: {e}")
-        return []
+        raise
 
 # Автоматическое закрытие браузера при выходе из программы
 import atexit
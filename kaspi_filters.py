@@ -1,12 +1,86 @@
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
-from selenium.common.exceptions import TimeoutException, NoSuchElementException
 import logging
-import time
+from urllib.parse import quote
+from page_ready import first_card, wait_rerender, wait_results_ready
+import metrics
 
+# Характеристики из extract_specs: ключ -> (подпись секции фильтров, подпись значения).
+# Подписи те же, что ищет apply_filters в боковой панели; коды фасетов берутся со страницы.
+FILTER_SECTIONS = {
+    'ram': ('Оперативная память', '{} ГБ'),
+    'storage': ('Объем накопителя', '{} ГБ'),
+    'processor': ('Процессор', '{}'),
+}
+
+# Поля фильтров в данных страницы: подпись, код секции, список значений и значение фасета
+_LABEL_KEYS = ('title', 'name', 'label')
+_CODE_KEYS = ('code', 'id', 'key')
+_OPTION_KEYS = ('values', 'options', 'items')
+_VALUE_KEYS = ('value', 'code', 'id')
+
+def _first(node, keys):
+    return next((node[key] for key in keys if node.get(key) not in (None, '')), None)
+
+def page_facets(data):
+    """Фасеты фильтров из данных страницы (__NEXT_DATA__): {подпись секции: (код, {подпись значения: значение})}.
+    Секция - объект с подписью, строковым кодом и списком значений с подписями."""
+    facets = {}
+    stack = [data]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, list):
+            stack.extend(node)
+            continue
+        if not isinstance(node, dict):
+            continue
+        label, code = _first(node, _LABEL_KEYS), _first(node, _CODE_KEYS)
+        options = next((node[key] for key in _OPTION_KEYS if isinstance(node.get(key), list)), None)
+        if isinstance(label, str) and isinstance(code, str) and options:
+            values = {}
+            for option in options:
+                if not isinstance(option, dict):
+                    continue
+                option_label = _first(option, _LABEL_KEYS)
+                option_value = _first(option, _VALUE_KEYS) or option_label
+                if isinstance(option_label, str):
+                    values[option_label.strip()] = str(option_value)
+            if values:
+                facets.setdefault(label.strip(), (code, values))
+        stack.extend(node.values())
+    return facets
+
+def build_filter_query(specs, facets):
+    """Строка параметра q (':код:значение:...') для specs по фасетам страницы; пустая, если фильтровать нечем."""
+    if not specs or not facets:
+        return ''
+    parts = []
+    for key, (section, value_format) in FILTER_SECTIONS.items():
+        if not specs.get(key) or section not in facets:
+            continue
+        code, values = facets[section]
+        wanted = value_format.format(specs[key])
+        # Как и в боковой панели: сначала точная подпись, затем содержащая нужное значение
+        value = values.get(wanted) or next((v for label, v in values.items() if wanted in label), None)
+        if value:
+            parts.append(f"{code}:{value}")
+    return ':' + ':'.join(parts) if parts else ''
+
+def filter_url(url, specs, facets):
+    """URL страницы поиска с уже примененными фильтрами или None, если на странице нет нужных фасетов."""
+    filter_query = build_filter_query(specs, facets)
+    if not filter_query:
+        return None
+    separator = '&' if '?' in url else '?'
+    return f"{url}{separator}q={quote(filter_query, safe='')}"
+
+@metrics.timed('browser.apply_filters')
 def apply_filters(driver, specs):
-    """Применяет фильтры на странице Kaspi"""
+    """Применяет фильтры на странице Kaspi кликами по боковой панели (запасной путь для filter_url).
+    Секции ищутся по подписи, поэтому у товаров без такой секции фильтр просто не применяется."""
+    # Selenium загружается только в режиме браузера
+    from selenium.webdriver.common.by import By
+    from selenium.webdriver.support.ui import WebDriverWait
+    from selenium.webdriver.support import expected_conditions as EC
+    from selenium.common.exceptions import TimeoutException, NoSuchElementException
     try:
         # Ждем загрузки фильтров
         filter_section = WebDriverWait(driver, 10).until(
@@ -28,11 +102,12 @@ def apply_filters(driver, specs):
                     EC.element_to_be_clickable((By.XPATH, 
                         f"//div[contains(text(), 'Оперативная память')]/..//label[contains(text(), '{specs['ram']} ГБ')]"))
                 )
+                old_card = first_card(driver)
                 ram_value.click()
                 logging.info(f"Applied RAM filter: {specs['ram']} ГБ")
                 
                 # Ждем обновления результатов
-                time.sleep(1)
+                wait_rerender(driver, old_card, step='filter_ram')
                 
             except (TimeoutException, NoSuchElementException) as e:
                 logging.warning(f"Failed to apply RAM filter: {e}")
@@ -52,11 +127,12 @@ def apply_filters(driver, specs):
                     EC.element_to_be_clickable((By.XPATH, 
                         f"//div[contains(text(), 'Объем накопителя')]/..//label[contains(text(), '{specs['storage']} ГБ')]"))
                 )
+                old_card = first_card(driver)
                 storage_value.click()
                 logging.info(f"Applied Storage filter: {specs['storage']} ГБ")
                 
                 # Ждем обновления результатов
-                time.sleep(1)
+                wait_rerender(driver, old_card, step='filter_storage')
                 
             except (TimeoutException, NoSuchElementException) as e:
                 logging.warning(f"Failed to apply Storage filter: {e}")
@@ -75,17 +151,18 @@ def apply_filters(driver, specs):
                     EC.element_to_be_clickable((By.XPATH, 
                         f"//div[contains(text(), 'Процессор')]/..//label[contains(text(), '{specs['processor']}')]"))
                 )
+                old_card = first_card(driver)
                 processor_value.click()
                 logging.info(f"Applied Processor filter: {specs['processor']}")
                 
                 # Ждем обновления результатов
-                time.sleep(1)
+                wait_rerender(driver, old_card, step='filter_processor')
                 
             except (TimeoutException, NoSuchElementException) as e:
                 logging.warning(f"Failed to apply Processor filter: {e}")
 
-        # Даем время на применение всех фильтров
-        time.sleep(2)
+        # Ждем, пока выдача после всех фильтров стабилизируется
+        wait_results_ready(driver, step='filters_done')
         
     except Exception as e:
         logging.error(f"Error applying filters: {e}")
\ No newline at end of file
@@ -1,137 +1,838 @@
-import argparse, os, time, random, math, logging
-from config import PROXIES, CHUNK_SIZE, FUZZY_THRESHOLD, SECONDARY_THRESHOLD
-from excel_utils import read_input_excel, write_output_chunks
-from kaspi_api import fetch_search_results
-from matching import choose_best_candidate, score_match
-from filters import extract_specs
-import pandas as pd
+import argparse, os, sys, time, logging, threading, functools
+_started = time.perf_counter()
+import startup
+# Замер импортов включается до загрузки остальных модулей
+if '--profile-startup' in sys.argv:
+    startup.trace_imports()
+from itertools import islice
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
+from contextlib import contextmanager
+from config import CHUNK_SIZE, OUTPUT_FORMAT, WRITE_WORKERS, COMBINED_FORMAT, FUZZY_THRESHOLD, SECONDARY_THRESHOLD, MAX_WORKERS, FETCH_MODE, STREAM_BATCH_SIZE, CATALOG_MIN_SCORE, PARALLEL_VARIANTS, PROXY_RATE, PROXY_DIRECT_RATE, PROXY_BURST, APPLY_SITE_FILTERS, SERVICE_HOST, SERVICE_PORT, PIPELINE, PIPELINE_PLAN_WORKERS, PIPELINE_PARSE_WORKERS, PIPELINE_SCORE_WORKERS
+from kaspi_api import fetch_search_results, fetch_search_page, parse_search_page, fetch_mode, get_pool, set_fetch_mode, set_base_url, close_driver
+from matching import choose_best_candidate, score_match, preprocess_text
+from filters import extract_specs, is_spec_part
+from search_cache import get_cache, disable_cache, set_cache_path
+from catalog import get_catalog, disable_catalog, set_catalog_path
+from journal import RowJournal, journal_path, shard_journal_path, discard_shard_journals, load_journals
+import memo
+import metrics
+import page_ready
+from pipeline import Pipeline, Stage, DONE
+import proxy_pool
+from proxy_pool import get_scheduler
+# pandas, openpyxl (excel_utils) и Selenium загружаются только на путях, где они нужны
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s')
 
-def process_file(input_path, sheet_name=None, input_col='Номенклатура поставщика', out_dir='./output', start_row=0, max_rows=None):
-    df = read_input_excel(input_path, sheet_name=sheet_name)
-    # Skip rows if needed
-    df = df.iloc[start_row:].reset_index(drop=True)
-    if max_rows:
-        df = df.head(int(max_rows))
-    if input_col not in df.columns:
-        raise KeyError(f"Column '{input_col}' not found in input file. Columns: {df.columns.tolist()}")
-    
-    queries = df[input_col].astype(str).fillna('').tolist()
-    results = []
+def build_search_queries(original_query):
+    """Варианты поисковых запросов для одной строки: от самого точного к самому общему."""
+    search_queries = []
     
-    for idx, q in enumerate(queries):
-        original_query = q.strip()
-        if not original_query:
-            results.append({'query': q, 'best_id': None, 'best_title': None, 'best_price': None, 'score': None, 'url': None})
-            continue
+    # 1. Сначала пробуем полное название с характеристиками
+    parts = original_query.split('/')
+    if len(parts) > 1:
+        # Извлекаем ключевые характеристики
+        specs = []
+        for part in parts[1:]:
+            # Ищем объем памяти, процессор, видеокарту
+            if is_spec_part(part):
+                specs.append(part.strip())
         
-        # Создаем варианты поисковых запросов
-        search_queries = []
+        # Формируем запрос с характеристиками
+        base_query = parts[0].strip()
+        if specs:
+            # Добавляем запрос с полными характеристиками
+            full_query = f"{base_query} {' '.join(specs[:2])}"  # Берем первые 2 важные характеристики
+            search_queries.append(full_query)
         
-        # 1. Сначала пробуем полное название с характеристиками
-        parts = original_query.split('/')
-        if len(parts) > 1:
-            # Извлекаем ключевые характеристики
-            specs = []
-            for part in parts[1:]:
-                # Ищем объем памяти, процессор, видеокарту
-                if any(x in part.lower() for x in ['gb', 'гб', 'tb', 'тб', 'core', 'ryzen', 'radeon', 'geforce', 'rtx', 'gtx']):
-                    specs.append(part.strip())
-            
-            # Формируем запрос с характеристиками
-            base_query = parts[0].strip()
-            if specs:
-                # Добавляем запрос с полными характеристиками
-                full_query = f"{base_query} {' '.join(specs[:2])}"  # Берем первые 2 важные характеристики
-                search_queries.append(full_query)
-            
-            # Добавляем запрос только с брендом и моделью
-            search_queries.append(base_query)
-        else:
-            search_queries.append(original_query)
-            
-        # 2. Если запрос не дал результатов, пробуем только бренд и модель
-        words = parts[0].split()
-        if len(words) >= 2:
-            brand_model = ' '.join(words[:2])
-            if brand_model not in search_queries:
-                search_queries.append(brand_model)
+        # Добавляем запрос только с брендом и моделью
+        search_queries.append(base_query)
+    else:
+        search_queries.append(original_query)
         
-        logging.info(f"Search variations for '{original_query}': {search_queries}")
-        
-        # Пробуем каждый вариант поиска
-        best_result = None
-        best_score = -1
-        proxy = random.choice(PROXIES) if PROXIES else None
+    # 2. Если запрос не дал результатов, пробуем только бренд и модель
+    words = parts[0].split()
+    if len(words) >= 2:
+        brand_model = ' '.join(words[:2])
+        if brand_model not in search_queries:
+            search_queries.append(brand_model)
+    
+    return search_queries
+
+def empty_result(q):
+    return {'query': q, 'best_id': None, 'best_title': None, 'best_price': None, 'score': None, 'url': None, 'status': "не найден", 'fetches': 0, 'elapsed': 0.0}
+
+# Статус строки, поиск которой упал: не "не найден", при --resume строка ищется заново
+ERROR_STATUS = "ошибка поиска"
+
+def error_result(q, error):
+    return dict(empty_result(q), status=ERROR_STATUS, error=str(error) or type(error).__name__)
+
+def search_products(query, proxy=None, specs=None):
+    """Поиск товаров с кэшем результатов перед обращением к Kaspi."""
+    # Без фильтров сайта характеристики учитываются только при выборе кандидата
+    if not APPLY_SITE_FILTERS:
+        specs = None
+    cache = get_cache()
+    if cache is not None:
+        cached = cache.get(query, specs)
+        if cached is not None:
+            logging.info(f"Cache hit for '{query}'")
+            metrics.count('cache.hit')
+            return cached
+        metrics.count('cache.miss')
+    
+    products = fetch_search_results(query, proxy=proxy, specs=specs)
+    # Пустой ответ не кэшируем: fetch_search_results возвращает [] и при ошибках
+    if cache is not None and products:
+        cache.put(query, specs, products)
+    catalog = get_catalog()
+    if catalog is not None and products:
+        catalog.add_products(products)
+    return products
+
+def match_in_catalog(original_query):
+    """Лучший товар из локального каталога, если совпадение надежное и цена свежая: (товар, score) или None."""
+    catalog = get_catalog()
+    if catalog is None:
+        return None
+    candidates = catalog.candidates(original_query)
+    if not candidates:
+        metrics.count('catalog.miss')
+        return None
+    scored = choose_best_candidate(original_query, candidates, topn=1)
+    best = scored[0]
+    if best['_score'] < CATALOG_MIN_SCORE or not catalog.is_fresh(best):
+        metrics.count('catalog.miss')
+        return None
+    metrics.count('catalog.hit')
+    return best, best['_score']
+
+def search_variants(original_query, search_queries, proxy=None, specs=None):
+    """Варианты поиска по очереди, пока один из них не даст score >= FUZZY_THRESHOLD.
+    Возвращает (лучший товар, score, число поисков)."""
+    best_result = None
+    best_score = -1
+    fetches = 0
+    errors = []
+    for search_query in search_queries:
+        try:
+            logging.info(f"Trying search query: {search_query}")
+            # Передаем характеристики для использования фильтров
+            fetches += 1
+            candidates = search_products(search_query, proxy=proxy, specs=specs)
+            if candidates:
+                logging.info(f"Found {len(candidates)} products")
+                # Для каждого кандидата проверяем соответствие оригинальному запросу
+                scored = choose_best_candidate(original_query, candidates, topn=5)
+                if scored:
+                    current_score = scored[0].get('_score', 0)
+                    if current_score > best_score:
+                        best_result = scored[0]
+                        best_score = current_score
+                        logging.info(f"Found better match: {best_result.get('title')} (score: {best_score})")
+                        logging.info(f"Product ID: {best_result.get('id')}, Price: {best_result.get('price')}")
+        except Exception as e:
+            logging.warning(f"Failed to fetch for '{search_query}': {e}")
+            errors.append(e)
+            continue
         
-        # Извлекаем характеристики для фильтров
-        specs = extract_specs(original_query)
-        logging.info(f"Extracted specs: {specs}")
+        # Если нашли хороший результат, можно прекратить поиск
+        if best_score >= FUZZY_THRESHOLD:
+            break
+    # Ни один вариант не загрузился: это ошибка строки, а не "не найден"
+    if errors and len(errors) == fetches:
+        raise errors[-1]
+    return best_result, best_score, fetches
+
+# Одновременный запуск вариантов поиска одной строки (--parallel-variants)
+_parallel_variants = PARALLEL_VARIANTS
+_variant_executor = None
+_variant_lock = threading.Lock()
+
+def set_parallel_variants(enabled, workers=MAX_WORKERS):
+    """Включает одновременный поиск вариантов; на каждую строку до трех потоков.
+    Вызывается до запуска строк: прежний пул закрывается для новых задач."""
+    global _parallel_variants, _variant_executor
+    with _variant_lock:
+        _parallel_variants = enabled
+        if _variant_executor is not None:
+            _variant_executor.shutdown(wait=False)
+            _variant_executor = None
+        if enabled:
+            _variant_executor = ThreadPoolExecutor(max_workers=max(1, int(workers)) * 3, thread_name_prefix='variant')
+
+def _get_variant_executor():
+    """Пул вариантов; при PARALLEL_VARIANTS из конфига создается при первой строке, под блокировкой:
+    первые строки приходят одновременно с нескольких потоков."""
+    global _variant_executor
+    with _variant_lock:
+        if _variant_executor is None:
+            _variant_executor = ThreadPoolExecutor(max_workers=max(1, int(MAX_WORKERS)) * 3, thread_name_prefix='variant')
+        return _variant_executor
+
+def search_variants_parallel(original_query, search_queries, proxy=None, specs=None):
+    """Все варианты поиска сразу на отдельных потоках; как только один дает score >= FUZZY_THRESHOLD,
+    еще не начатые варианты не запускаются. Уже начатые поиски не прерываются: они дорабатывают
+    (загрузка, токен прокси, браузер из пула), но их результат не ждем и не учитываем."""
+    cancelled = threading.Event()
+    started = []
+    
+    def run(search_query):
+        if cancelled.is_set():
+            return None
+        started.append(search_query)
+        logging.info(f"Trying search query: {search_query}")
+        candidates = search_products(search_query, proxy=proxy, specs=specs)
+        if not candidates or cancelled.is_set():
+            return None
+        logging.info(f"Found {len(candidates)} products")
+        scored = choose_best_candidate(original_query, candidates, topn=5)
+        return scored[0] if scored else None
+    
+    executor = _get_variant_executor()
+    futures = {executor.submit(run, search_query): search_query for search_query in search_queries}
+    best_result = None
+    best_score = -1
+    errors = []
+    for future in as_completed(futures):
+        try:
+            top = future.result()
+        except Exception as e:
+            logging.warning(f"Failed to fetch for '{futures[future]}': {e}")
+            errors.append(e)
+            continue
+        if top and top.get('_score', 0) > best_score:
+            best_result = top
+            best_score = top.get('_score', 0)
+            logging.info(f"Found better match: {best_result.get('title')} (score: {best_score})")
         
-        for search_query in search_queries:
-            try:
-                logging.info(f"Trying search query: {search_query}")
-                # Передаем характеристики для использования фильтров
-                candidates = fetch_search_results(search_query, proxy=proxy, specs=specs)
-                if candidates:
-                    logging.info(f"Found {len(candidates)} products")
-                    # Для каждого кандидата проверяем соответствие оригинальному запросу
-                    scored = choose_best_candidate(original_query, candidates, topn=5)
-                    if scored:
-                        current_score = scored[0].get('_score', 0)
-                        if current_score > best_score:
-                            best_result = scored[0]
-                            best_score = current_score
-                            logging.info(f"Found better match: {best_result.get('title')} (score: {best_score})")
-                            logging.info(f"Product ID: {best_result.get('id')}, Price: {best_result.get('price')}")
-            except Exception as e:
-                logging.warning(f"Failed to fetch for '{search_query}': {e}")
-                continue
+        # Хороший результат найден: не начатые варианты отменяем, начатые дорабатывают без нас
+        if best_score >= FUZZY_THRESHOLD:
+            cancelled.set()
+            for other in futures:
+                other.cancel()
+            in_flight = sum(1 for other in futures if not other.done())
+            metrics.count('variants.skipped', len(search_queries) - len(started))
+            metrics.count('variants.abandoned', in_flight)
+            logging.info(f"Good match for '{original_query}': {len(search_queries) - len(started)} variants skipped, "
+                         f"{in_flight} still running in background")
+            break
+    if errors and len(errors) == len(search_queries):
+        raise errors[-1]
+    return best_result, best_score, len(started)
+
+@metrics.profiled
+@metrics.timed('row')
+def process_query(q):
+    """Поиск и выбор лучшего товара Kaspi для одной строки поставщика."""
+    started = time.perf_counter()
+    original_query = q.strip()
+    if not original_query:
+        return empty_result(q)
+    
+    # Создаем варианты поисковых запросов
+    search_queries = build_search_queries(original_query)
+    logging.info(f"Search variations for '{original_query}': {search_queries}")
+    
+    best_result = None
+    best_score = -1
+    
+    # Сначала локальный каталог: в сеть идем, только если совпадение слабое или цена устарела
+    local = match_in_catalog(original_query)
+    if local is not None:
+        best_result, best_score = local
+        search_queries = []
+        logging.info(f"Catalog match: {best_result.get('title')} (score: {best_score})")
+    
+    # Извлекаем характеристики для фильтров
+    specs = extract_specs(original_query)
+    logging.info(f"Extracted specs: {specs}")
+    
+    # Пробуем варианты поиска: по очереди или все сразу с отменой лишних
+    if not search_queries:
+        fetches = 0
+    elif _parallel_variants and len(search_queries) > 1:
+        best_result, best_score, fetches = search_variants_parallel(original_query, search_queries, specs=specs)
+    else:
+        best_result, best_score, fetches = search_variants(original_query, search_queries, specs=specs)
+    
+    return row_result(q, best_result, best_score, fetches, started)
+
+def row_result(q, best_result, best_score, fetches, started):
+    """Результат строки по лучшему товару; возвращается всегда, независимо от score."""
+    # Определяем статус поиска
+    status = "не найден"
+    if best_result and best_score >= FUZZY_THRESHOLD:
+        status = "найден"
+    elif best_result and best_score > 0:
+        status = f"возможное совпадение (score: {best_score})"
+    
+    return {
+        'query': q,
+        'best_id': best_result.get('id') if best_result else None,
+        'best_title': best_result.get('title') if best_result else None,
+        'best_price': best_result.get('price') if best_result else None,
+        'score': best_score if best_score > -1 else None,
+        'url': best_result.get('url') if best_result else None,
+        'status': f"{status} (score: {best_score:.2f})" if best_result else "не найден",
+        'fetches': fetches,
+        'elapsed': round(time.perf_counter() - started, 4)
+    }
+
+# Строки через конвейер стадий вместо process_query на поток (--no-pipeline отключает)
+_pipeline = PIPELINE
+
+def set_pipeline(enabled):
+    global _pipeline
+    _pipeline = enabled
+
+class _RowTask:
+    """Строка (группа одинаковых строк) в конвейере: варианты поиска, текущая загрузка и лучший товар."""
+
+    def __init__(self, q, rows):
+        self.query = q
+        self.rows = rows
+        self.original = q.strip()
+        self.started = None
+        self.variants = []
+        self.variant = 0
+        self.specs = None
+        self.mode = None
+        self.html = None
+        self.products = None
+        self.best = None
+        self.score = -1
+        self.fetches = 0
+        self.errors = []
+        self.result = None
+        # Строка в выборке --profile-every: каждая ее стадия профилируется в своем потоке
+        self.profiled = metrics.profile_sampled()
+
+def _plan_stage(task):
+    """Варианты поиска и локальный каталог; строки с надежным совпадением в каталоге в сеть не идут."""
+    task.started = time.perf_counter()
+    if not task.original:
+        task.result = empty_result(task.query)
+        return DONE
+    task.variants = build_search_queries(task.original)
+    logging.info(f"Search variations for '{task.original}': {task.variants}")
+    try:
+        local = match_in_catalog(task.original)
+    except Exception as e:
+        logging.warning(f"Catalog lookup failed for '{task.original}': {e}")
+        local = None
+    if local is not None:
+        task.best, task.score = local
+        logging.info(f"Catalog match: {task.best.get('title')} (score: {task.score})")
+        return _finish(task)
+    # Без фильтров сайта характеристики учитываются только при выборе кандидата
+    task.specs = extract_specs(task.original) if APPLY_SITE_FILTERS else None
+    return 'fetch'
+
+def _variant_failed(task, error):
+    """Сбой текущего варианта, как в search_variants: строка переходит к следующему варианту
+    и сохраняет лучший товар прошлых вариантов."""
+    logging.warning(f"Failed to fetch for '{task.variants[task.variant]}': {error}")
+    task.errors.append(error)
+    task.html = None
+    task.products = []
+    return 'score'
+
+def _fetch_stage(task):
+    """Загрузка страницы текущего варианта (HTTP или браузер); ответ из кэша минует разбор."""
+    import requests
+    query = task.variants[task.variant]
+    if task.mode is None:
+        logging.info(f"Trying search query: {query}")
+        task.fetches += 1
+        task.mode = fetch_mode()
+        cache = get_cache()
+        try:
+            cached = cache.get(query, task.specs) if cache is not None else None
+        except Exception as e:
+            logging.warning(f"Search cache read failed for '{query}': {e}")
+            cached = None
+        if cached is not None:
+            logging.info(f"Cache hit for '{query}'")
+            metrics.count('cache.hit')
+            task.products = cached
+            return 'score'
+        if cache is not None:
+            metrics.count('cache.miss')
+    try:
+        task.html = fetch_search_page(query, task.specs, mode=task.mode)
+    except requests.RequestException as e:
+        if task.mode != 'http':
+            return _variant_failed(task, e)
+        logging.warning(f"HTTP fetch failed for '{query}': {e}, falling back to browser")
+        task.mode = 'browser'
+        return _fetch_stage(task)
+    except Exception as e:
+        return _variant_failed(task, e)
+    return 'parse'
+
+def _parse_stage(task):
+    """Разбор страницы; страница без __NEXT_DATA__ возвращается на загрузку браузером."""
+    query = task.variants[task.variant]
+    try:
+        products = parse_search_page(task.html, task.mode)
+    except Exception as e:
+        return _variant_failed(task, e)
+    task.html = None
+    if products is None:
+        logging.info(f"No __NEXT_DATA__ for '{query}', falling back to browser")
+        task.mode = 'browser'
+        return 'fetch'
+    if not products and task.mode == 'browser':
+        logging.warning(f"No products found for query: {query}")
+    # Пустой ответ не кэшируем: он бывает и при ошибках. Сбой кэша или каталога не отменяет выдачу
+    if products:
+        try:
+            cache = get_cache()
+            if cache is not None:
+                cache.put(query, task.specs, products)
+            catalog = get_catalog()
+            if catalog is not None:
+                catalog.add_products(products)
+        except Exception as e:
+            logging.warning(f"Could not store results for '{query}': {e}")
+    task.products = products
+    return 'score'
+
+def _score_stage(task):
+    """Лучший кандидат варианта; при слабом совпадении строка уходит на загрузку следующего варианта."""
+    products = task.products
+    task.products = None
+    if products:
+        logging.info(f"Found {len(products)} products")
+        try:
+            scored = choose_best_candidate(task.original, products, topn=5)
+        except Exception as e:
+            logging.warning(f"Failed to score '{task.variants[task.variant]}': {e}")
+            task.errors.append(e)
+            scored = None
+        if scored and scored[0].get('_score', 0) > task.score:
+            task.best = scored[0]
+            task.score = task.best.get('_score', 0)
+            logging.info(f"Found better match: {task.best.get('title')} (score: {task.score})")
+            logging.info(f"Product ID: {task.best.get('id')}, Price: {task.best.get('price')}")
+    if task.score >= FUZZY_THRESHOLD or task.variant + 1 >= len(task.variants):
+        return _finish(task)
+    task.variant += 1
+    task.mode = None
+    return 'fetch'
+
+def _finish(task):
+    # Ни один вариант не загрузился: это ошибка строки, а не "не найден" (как в search_variants)
+    if task.errors and len(task.errors) == task.fetches:
+        task.result = error_result(task.query, task.errors[-1])
+    else:
+        task.result = row_result(task.query, task.best, task.score, task.fetches, task.started)
+    metrics.observe('row', time.perf_counter() - task.started)
+    if task.profiled:
+        metrics.count('profile.rows')
+    return DONE
+
+def _profiled_stage(func):
+    """Стадия конвейера, которая профилирует строки из выборки: process_query здесь не вызывается,
+    и строка проходит стадии в разных потоках, поэтому профиль собирается по вызовам стадий."""
+    @functools.wraps(func)
+    def stage(task):
+        if not task.profiled:
+            return func(task)
+        with metrics.profile_section():
+            return func(task)
+    return stage
+
+def row_pipeline(workers):
+    """Конвейер строки: plan -> fetch (workers потоков, по браузеру или соединению на поток) -> parse -> score."""
+    return Pipeline([
+        Stage('plan', _profiled_stage(_plan_stage), PIPELINE_PLAN_WORKERS),
+        Stage('fetch', _profiled_stage(_fetch_stage), workers),
+        Stage('parse', _profiled_stage(_parse_stage), PIPELINE_PARSE_WORKERS),
+        Stage('score', _profiled_stage(_score_stage), PIPELINE_SCORE_WORKERS),
+    ])
+
+@contextmanager
+def row_executor(workers):
+    """Исполнитель строк для run_queries: конвейер стадий или пул потоков с process_query на строку.
+    С --parallel-variants строки идут через process_query: конвейер пробует варианты по очереди."""
+    if _pipeline and not _parallel_variants:
+        pipeline = row_pipeline(workers)
+        try:
+            yield pipeline
+        finally:
+            # Потоки стадий живут весь запуск; при ошибке недошедшие строки отбрасываются
+            pipeline.close()
+            logging.info(f"Pipeline stage stats: {pipeline.stats()}")
+        return
+    executor = ThreadPoolExecutor(max_workers=workers)
+    try:
+        yield executor
+    except BaseException:
+        # Ctrl+C или ошибка записи: строки из очереди больше не запускаем, их никто не запишет
+        executor.shutdown(wait=True, cancel_futures=True)
+        raise
+    executor.shutdown()
+
+def plan_queries(queries, indices):
+    """Группирует строки с одинаковым нормализованным запросом: {ключ: [индексы строк]}."""
+    groups = {}
+    for idx in indices:
+        key = preprocess_text(queries[idx].strip())
+        groups.setdefault(key, []).append(idx)
+    return groups
+
+# Колонки с результатами Kaspi в выходном файле
+KASPI_COLUMNS = ['код каспи', 'цена каспи', 'статус поиска']
+
+def kaspi_values(result):
+    """Значения колонок KASPI_COLUMNS для результата строки."""
+    return (
+        str(result['best_id']) if result['best_id'] else "не найден",
+        float(result['best_price']) if result['best_price'] else None,
+        result['status'],
+    )
+
+def open_journal(out_dir, base_name, resume):
+    """Журнал строк и уже обработанные строки из него (при --resume)."""
+    path = journal_path(out_dir, base_name)
+    done = {}
+    if resume:
+        done = load_journals(out_dir, base_name)
+        logging.info(f"Resuming from {path}: {len(done)} rows in journals")
+    else:
+        discard_shard_journals(out_dir, base_name)
+    return RowJournal(path, append=resume), done
+
+def start_queries(queries, first_row, executor, done, progress):
+    """Первая половина run_queries: строки из журнала (done) восстанавливаются, поиск остальных
+    запускается сразу. Возвращает (результаты с пропусками, итератор готовых групп) для finish_queries."""
+    results = [None] * len(queries)
+    # Индексы в журнале абсолютные (с учетом start_row), чтобы продолжение работало с любым --start-row
+    for idx, q in enumerate(queries):
+        entry = done.get(first_row + idx)
+        # Строку из журнала берем, только если запрос не изменился и поиск не упал
+        if entry is not None and entry.get('query') == q and not entry.get('error'):
+            results[idx] = entry
+    pending = [idx for idx, r in enumerate(results) if r is None]
+    progress['restored'] += len(queries) - len(pending)
+    
+    # Одинаковые запросы ищем один раз и раздаем результат всем строкам группы
+    groups = plan_queries(queries, pending)
+    progress['duplicates'] += len(pending) - len(groups)
+    logging.info(f"Planned {len(groups)} distinct searches for {len(pending)} rows "
+                 f"({len(pending) - len(groups)} duplicate rows)")
+    return results, _submit_groups(queries, groups, executor)
+
+def finish_queries(queries, first_row, started, journal, progress):
+    """Вторая половина run_queries: ждет группы, пишет строки в журнал и возвращает результаты по порядку."""
+    results, completed_groups = started
+    # Журнал и результаты пишутся в этом потоке - последняя стадия конвейера
+    for rows, result in completed_groups:
+        progress['saved_fetches'] += result.get('fetches', 0) * (len(rows) - 1)
+        for n, idx in enumerate(rows):
+            results[idx] = dict(result, query=queries[idx])
+            if n:
+                # Поиск группы учитывается один раз: у повторных строк нет своих загрузок и времени
+                results[idx].update(fetches=0, elapsed=0.0, duplicate=True)
+            journal.record(first_row + idx, results[idx])
+            completed = progress['completed']
+            completed.append(results[idx])
+            progress['processed'] += 1
             
-            # Если нашли хороший результат, можно прекратить поиск
-            if best_score >= FUZZY_THRESHOLD:
-                break
-        
-        # Определяем статус поиска
-        status = "не найден"
-        if best_result and best_score >= FUZZY_THRESHOLD:
-            status = "найден"
-        elif best_result and best_score > 0:
-            status = f"возможное совпадение (score: {best_score})"
-        
-        # Добавляем результат всегда, независимо от score
-        results.append({
-            'query': q,
-            'best_id': best_result.get('id') if best_result else None,
-            'best_title': best_result.get('title') if best_result else None,
-            'best_price': best_result.get('price') if best_result else None,
-            'score': best_score if best_score > -1 else None,
-            'url': best_result.get('url') if best_result else None,
-            'status': f"{status} (score: {best_score:.2f})" if best_result else "не найден"
-        })
-        
-        # Прогресс с дополнительной информацией
-        if (idx + 1) % 10 == 0:
-            found = sum(1 for r in results[-10:] if r['best_id'] is not None)
-            not_found = 10 - found
-            logging.info(f"Processed {idx + 1} / {len(queries)} items. Last 10 items: {found} found, {not_found} not found")
+            # Прогресс с дополнительной информацией (хранятся только последние 10 строк)
+            if progress['processed'] % 10 == 0:
+                found = sum(1 for r in completed[-10:] if r['best_id'] is not None)
+                not_found = 10 - found
+                logging.info(f"Processed {progress['processed']} / {progress['total'] or '?'} items. Last 10 items: {found} found, {not_found} not found")
+                del completed[:-10]
+    return results
+
+def run_queries(queries, first_row, executor, journal, done, progress):
+    """Обрабатывает блок запросов, начинающийся со строки first_row, и возвращает результаты по порядку.
     
-    # Обновляем колонки в DataFrame
+    Строки из журнала (done) восстанавливаются, одинаковые запросы ищутся один раз."""
+    started = start_queries(queries, first_row, executor, done, progress)
+    return finish_queries(queries, first_row, started, journal, progress)
+
+def _submit_groups(queries, groups, executor):
+    """Запускает поиск групп сразу; возвращает итератор (строки группы, результат) по мере готовности:
+    через конвейер или process_query в пуле потоков."""
+    if isinstance(executor, Pipeline):
+        batch = executor.submit(_RowTask(queries[rows[0]], rows) for rows in groups.values())
+        return _pipeline_groups(batch)
+    futures = {executor.submit(process_query, queries[rows[0]]): rows for rows in groups.values()}
+    return _future_groups(queries, futures)
+
+def _pipeline_groups(batch):
+    for task, error in batch.results():
+        if error is not None or task.result is None:
+            logging.error(f"Failed to process '{task.query}': {error}")
+            task.result = error_result(task.query, error)
+        yield task.rows, task.result
+
+def _future_groups(queries, futures):
+    for future in as_completed(futures):
+        rows = futures[future]
+        try:
+            result = future.result()
+        except Exception as e:
+            logging.error(f"Failed to process '{queries[rows[0]]}': {e}")
+            result = error_result(queries[rows[0]], e)
+        yield rows, result
+
+def new_progress(total=None):
+    return {'completed': [], 'processed': 0, 'total': total, 'restored': 0, 'duplicates': 0, 'saved_fetches': 0}
+
+def log_run_stats(progress):
+    logging.info(f"Restored {progress['restored']} rows from journal")
+    logging.info(f"Deduplication saved {progress['saved_fetches']} fetches on {progress['duplicates']} duplicate rows")
+    cache = get_cache()
+    if cache is not None:
+        logging.info(f"Search cache stats: {cache.stats()}")
+    logging.info(f"Text cache stats: {memo.stats()}")
+    logging.info(f"Browser wait stats: {page_ready.wait_stats()}")
+    logging.info(f"Proxy stats: {get_scheduler().stats()}")
+
+def read_input_rows(input_path, sheet_name, input_col, start_row=0, max_rows=None):
+    """Входной DataFrame начиная со строки start_row (не больше max_rows строк)."""
+    from excel_utils import read_input_excel, read_excel_columns
+    # Колонку проверяем по заголовку, до чтения всего файла
+    columns = read_excel_columns(input_path, sheet_name=sheet_name)
+    if input_col not in columns:
+        raise KeyError(f"Column '{input_col}' not found in input file. Columns: {columns}")
+    df = read_input_excel(input_path, sheet_name=sheet_name)
+    # Skip rows if needed
+    df = df.iloc[start_row:].reset_index(drop=True)
+    if max_rows:
+        df = df.head(int(max_rows))
+    if input_col not in df.columns:
+        raise KeyError(f"Column '{input_col}' not found in input file. Columns: {df.columns.tolist()}")
+    return df
+
+def build_output(df, results):
+    """Входной DataFrame с добавленными колонками Kaspi по результатам строк."""
+    import pandas as pd
     out_df = df.copy()
     
     # Создаем временные колонки для Kaspi данных
-    kaspi_ids = [str(result['best_id']) if result['best_id'] else "не найден" for result in results]
-    kaspi_prices = [float(result['best_price']) if result['best_price'] else None for result in results]
-    kaspi_status = [result['status'] for result in results]
+    kaspi_ids, kaspi_prices, kaspi_status = zip(*(kaspi_values(r) for r in results)) if results else ([], [], [])
     
     # Добавляем колонки для Kaspi данных
-    out_df['код каспи'] = pd.Series(kaspi_ids, dtype='object')
-    out_df['цена каспи'] = pd.Series(kaspi_prices, dtype='float64')
-    out_df['статус поиска'] = pd.Series(kaspi_status, dtype='object')
+    out_df['код каспи'] = pd.Series(list(kaspi_ids), dtype='object')
+    out_df['цена каспи'] = pd.Series(list(kaspi_prices), dtype='float64')
+    out_df['статус поиска'] = pd.Series(list(kaspi_status), dtype='object')
+    return out_df
+
+def runtime_stats():
+    """Состояние кэшей, каталога, ожиданий браузера и прокси процесса (для /stats сервиса)."""
+    cache = get_cache()
+    catalog = get_catalog()
+    return {
+        'search_cache': cache.stats() if cache is not None else None,
+        'catalog_products': catalog.size() if catalog is not None else None,
+        'text_cache': memo.stats(),
+        'browser_waits': page_ready.wait_stats(),
+        'proxies': get_scheduler().stats(),
+        'metrics': metrics.snapshot() if metrics.enabled() else None,
+    }
+
+def serve_queries(host=SERVICE_HOST, port=SERVICE_PORT, workers=MAX_WORKERS, warm_browser=False):
+    """Сервис сопоставления: пул браузеров, кэши и каталог прогреваются один раз и живут между запросами.
+    warm_browser - запустить первый браузер заранее (режим загрузки browser)."""
+    from service import serve
+    workers = max(1, int(workers or 1))
+    pool = get_pool(size=workers)
+    get_cache()
+    get_catalog()
+    if warm_browser:
+        # Первый запрос не должен ждать старта Chrome
+        pool.checkin(pool.checkout())
+    # Упавший поиск - строка с ошибкой в ответе, как в пакетной обработке, а не 500 на весь /batch
+    serve(process_query, host=host, port=port, workers=workers, stats=runtime_stats, on_error=error_result)
+
+def process_file(input_path, sheet_name=None, input_col='Номенклатура поставщика', out_dir='./output', start_row=0, max_rows=None, workers=MAX_WORKERS, resume=False):
+    df = read_input_rows(input_path, sheet_name, input_col, start_row, max_rows)
+    
+    base_name = os.path.splitext(os.path.basename(input_path))[0]
+    queries = df[input_col].astype(str).fillna('').tolist()
+    journal, done = open_journal(out_dir, base_name, resume)
+    progress = new_progress(len(queries))
+    
+    # Строки раздаются воркерам, каждый берет браузер из пула на время поиска
+    workers = max(1, int(workers or 1))
+    get_pool(size=workers)
+    logging.info(f"Processing {len(queries)} items with {workers} workers")
+    
+    try:
+        with row_executor(workers) as executor:
+            results = run_queries(queries, start_row, executor, journal, done, progress)
+    finally:
+        journal.close()
+    log_run_stats(progress)
     
     # Записываем результат
-    paths = write_output_chunks(out_df, out_dir, base_name=os.path.splitext(os.path.basename(input_path))[0], chunk_size=CHUNK_SIZE)
+    from excel_utils import write_output_chunks
+    out_df = build_output(df, results)
+    paths = write_output_chunks(out_df, out_dir, base_name=base_name, chunk_size=CHUNK_SIZE)
+    logging.info(f"Wrote {len(paths)} files to {out_dir}")
+    return paths
+
+def split_rows(total, shards):
+    """Делит total строк на не больше shards непрерывных диапазонов (смещение, число строк)."""
+    shards = max(1, min(int(shards), total))
+    size, extra = divmod(total, shards)
+    ranges = []
+    offset = 0
+    for shard in range(shards):
+        count = size + (1 if shard < extra else 0)
+        ranges.append((offset, count))
+        offset += count
+    return ranges
+
+def _init_shard(settings, shards, workers):
+    """Настройки запуска в процессе шарда: глобальное состояние родителя при spawn не наследуется."""
+    set_fetch_mode(settings.get('fetch_mode', FETCH_MODE))
+    if settings.get('base_url'):
+        set_base_url(settings['base_url'])
+    if settings.get('cache_path'):
+        set_cache_path(settings['cache_path'])
+    if settings.get('catalog_path'):
+        set_catalog_path(settings['catalog_path'])
+    if not settings.get('cache', True):
+        disable_cache()
+    if not settings.get('catalog', True):
+        disable_catalog()
+    if settings.get('parallel_variants'):
+        set_parallel_variants(True, workers=workers)
+    set_pipeline(settings.get('pipeline', PIPELINE))
+    if settings.get('metrics'):
+        metrics.enable(profile_every=settings.get('profile_every'))
+    # Token bucket прокси делится между шардами, чтобы суммарная нагрузка на прокси не выросла;
+    # паузы ведутся на воркер, их у каждого шарда свои
+    limits = {'rate': PROXY_RATE / shards, 'direct_rate': PROXY_DIRECT_RATE / shards,
+              'burst': max(1, PROXY_BURST // shards)}
+    proxy_pool.configure(**dict(limits, **settings.get('proxy', {})))
+
+def _run_shard(shard, shards, queries, first_row, workers, out_dir, base_name, done, resume, settings):
+    """Обрабатывает диапазон строк в отдельном процессе со своими браузерами, сессиями и кэшами."""
+    _init_shard(settings, shards, workers)
+    journal = RowJournal(shard_journal_path(out_dir, base_name, shard), append=resume)
+    progress = new_progress(len(queries))
+    get_pool(size=workers)
+    logging.info(f"Shard {shard}: rows {first_row}-{first_row + len(queries) - 1} with {workers} workers")
+    try:
+        with row_executor(workers) as executor:
+            results = run_queries(queries, first_row, executor, journal, done, progress)
+    finally:
+        journal.close()
+        close_driver()
+        if settings.get('metrics'):
+            metrics.write_report(f"{settings['metrics']}.shard{shard}")
+    log_run_stats(progress)
+    return results
+
+def process_file_sharded(input_path, sheet_name=None, input_col='Номенклатура поставщика', out_dir='./output', start_row=0, max_rows=None, workers=MAX_WORKERS, resume=False, shards=None, settings=None):
+    """Как process_file, но строки делятся на shards диапазонов (по умолчанию по числу ядер),
+    каждый обрабатывается в своем процессе с workers браузерами; результаты собираются по порядку.
+    
+    settings - настройки запуска для процессов шардов: fetch_mode, base_url, cache, catalog,
+    cache_path, catalog_path, parallel_variants, pipeline, metrics (префикс отчета), profile_every, proxy (параметры ProxyScheduler)."""
+    df = read_input_rows(input_path, sheet_name, input_col, start_row, max_rows)
+    
+    base_name = os.path.splitext(os.path.basename(input_path))[0]
+    queries = df[input_col].astype(str).fillna('').tolist()
+    ranges = split_rows(len(queries), shards or os.cpu_count() or 1)
+    workers = max(1, int(workers or 1))
+    
+    done = {}
+    if resume:
+        done = load_journals(out_dir, base_name)
+        logging.info(f"Resuming {input_path}: {len(done)} rows in journals")
+    else:
+        # Журналы прошлого запуска с другим числом шардов не должны попасть в следующее продолжение
+        discard_shard_journals(out_dir, base_name)
+        if os.path.exists(journal_path(out_dir, base_name)):
+            os.remove(journal_path(out_dir, base_name))
+    logging.info(f"Processing {len(queries)} items in {len(ranges)} shards with {workers} workers each")
+    
+    results = [None] * len(queries)
+    # spawn: у каждого шарда чистый процесс без унаследованных потоков, браузеров и соединений SQLite
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=len(ranges), mp_context=context) as executor:
+        futures = {}
+        for shard, (offset, count) in enumerate(ranges):
+            first_row = start_row + offset
+            shard_done = {row: done[row] for row in range(first_row, first_row + count) if row in done}
+            future = executor.submit(_run_shard, shard, len(ranges), queries[offset:offset + count], first_row,
+                                     workers, out_dir, base_name, shard_done, resume, settings or {})
+            futures[future] = (shard, offset)
+        for future in as_completed(futures):
+            shard, offset = futures[future]
+            shard_results = future.result()
+            results[offset:offset + len(shard_results)] = shard_results
+            logging.info(f"Shard {shard} finished: {len(shard_results)} rows")
+    
+    # Записываем результат
+    from excel_utils import write_output_chunks
+    out_df = build_output(df, results)
+    paths = write_output_chunks(out_df, out_dir, base_name=base_name, chunk_size=CHUNK_SIZE)
+    logging.info(f"Wrote {len(paths)} files to {out_dir}")
+    return paths
+
+def process_file_streaming(input_path, sheet_name=None, input_col='Номенклатура поставщика', out_dir='./output', start_row=0, max_rows=None, workers=MAX_WORKERS, resume=False):
+    """Как process_file, но строки читаются и пишутся потоково блоками по STREAM_BATCH_SIZE:
+    память не зависит от размера входного файла."""
+    from excel_utils import iter_excel_rows, ChunkedOutputWriter
+    columns, rows = iter_excel_rows(input_path, sheet_name=sheet_name)
+    if input_col not in columns:
+        raise KeyError(f"Column '{input_col}' not found in input file. Columns: {columns}")
+    col_idx = columns.index(input_col)
+    out_columns = columns + [c for c in KASPI_COLUMNS if c not in columns]
+    kaspi_idx = [out_columns.index(c) for c in KASPI_COLUMNS]
+    
+    base_name = os.path.splitext(os.path.basename(input_path))[0]
+    rows = islice(rows, start_row, start_row + int(max_rows) if max_rows else None)
+    writer = ChunkedOutputWriter(out_dir, out_columns, base_name=base_name, chunk_size=CHUNK_SIZE)
+    journal, done = open_journal(out_dir, base_name, resume)
+    progress = new_progress()
+    
+    workers = max(1, int(workers or 1))
+    get_pool(size=workers)
+    logging.info(f"Streaming {input_path} with {workers} workers, batches of {STREAM_BATCH_SIZE} rows")
+    
+    first_row = start_row
+    try:
+        with row_executor(workers) as executor:
+            previous = None
+            while True:
+                # Следующий блок запускается до того, как дописан предыдущий: загрузки не простаивают
+                # на хвосте блока, а в памяти не больше двух блоков
+                batch = list(islice(rows, STREAM_BATCH_SIZE))
+                current = None
+                if batch:
+                    queries = [str(row[col_idx]) if row[col_idx] is not None else '' for row in batch]
+                    current = (batch, queries, first_row, start_queries(queries, first_row, executor, done, progress))
+                    first_row += len(batch)
+                if previous is not None:
+                    prev_batch, prev_queries, prev_first, started = previous
+                    results = finish_queries(prev_queries, prev_first, started, journal, progress)
+                    for row, result in zip(prev_batch, results):
+                        values = list(row) + [None] * (len(out_columns) - len(row))
+                        for i, value in zip(kaspi_idx, kaspi_values(result)):
+                            values[i] = value
+                        writer.write_row(values)
+                if current is None:
+                    break
+                previous = current
+    finally:
+        journal.close()
+        paths = writer.close()
+    log_run_stats(progress)
+    
     logging.info(f"Wrote {len(paths)} files to {out_dir}")
     return paths
 
@@ -140,26 +841,97 @@ if __name__ == '__main__':
     group = parser.add_mutually_exclusive_group(required=True)
     group.add_argument('--input', '-i', help='Input Excel file path')
     group.add_argument('--query', '-q', help='Single query to process')
+    group.add_argument('--reprice', nargs='+', metavar='OUTPUT_FILE',
+                       help='Refresh prices of a previous output (all its parts) by known Kaspi codes')
+    group.add_argument('--serve', action='store_true', help='Run the matcher as a local HTTP/JSON service with warm browsers and caches')
     
     parser.add_argument('--sheet', '-s', default=None, help='Sheet name (optional, for Excel input)')
     parser.add_argument('--col', '-c', default='Номенклатура поставщика', help='Column name with queries (for Excel input)')
     parser.add_argument('--out', default='./output', help='Output directory')
     parser.add_argument('--start-row', type=int, default=0, help='Start processing from this row (0-based index)')
     parser.add_argument('--max-rows', type=int, default=None, help='Limit input rows to first N rows (for testing)')
+    parser.add_argument('--workers', '-w', type=int, default=MAX_WORKERS, help='Number of parallel browsers/workers')
+    parser.add_argument('--fetch-mode', choices=['http', 'browser'], default=FETCH_MODE,
+                        help='http: plain requests with browser fallback; browser: always Selenium')
+    parser.add_argument('--format', choices=['xlsx', 'csv', 'parquet'], default=OUTPUT_FORMAT,
+                        help='Output part format (xlsx uses xlsxwriter when installed, parquet needs pyarrow)')
+    parser.add_argument('--write-workers', type=int, default=WRITE_WORKERS, metavar='N',
+                        help='Processes writing output parts in parallel (0 = one per CPU core)')
+    parser.add_argument('--combined', choices=['parquet', 'csv'], default=COMBINED_FORMAT or None,
+                        help='Also write all result rows to a single parquet or csv file')
+    parser.add_argument('--stream', action='store_true', help='Read and write Excel row by row (constant memory for huge inputs)')
+    parser.add_argument('--shards', type=int, default=None, metavar='N',
+                        help='Split rows into N ranges processed in separate processes, each with --workers browsers (0 = one per CPU core)')
+    parser.add_argument('--resume', action='store_true', help='Skip rows already recorded in the output journal and merge them into the result')
+    parser.add_argument('--metrics', default=None, metavar='PREFIX',
+                        help='Collect per-stage timings and write PREFIX.json / PREFIX.csv after the run')
+    parser.add_argument('--profile-every', type=int, default=0, metavar='N',
+                        help='With --metrics, cProfile every N-th row into PREFIX.prof')
+    parser.add_argument('--parallel-variants', action='store_true', default=PARALLEL_VARIANTS,
+                        help='Run the search variants of a row concurrently and cancel the rest on a good match')
+    parser.add_argument('--no-pipeline', action='store_true', default=not PIPELINE,
+                        help='Search each row start to finish on one thread instead of the plan/fetch/parse/score pipeline')
+    parser.add_argument('--no-catalog', action='store_true', help='Do not match against or grow the local product catalog')
+    parser.add_argument('--host', default=SERVICE_HOST, help='Service address for --serve')
+    parser.add_argument('--port', type=int, default=SERVICE_PORT, help='Service port for --serve')
+    parser.add_argument('--profile-startup', action='store_true',
+                        help='Print import, chromedriver resolution and browser launch times on exit')
+    parser.add_argument('--no-cache', action='store_true', help='Bypass the on-disk search result cache')
+    parser.add_argument('--purge-cache', action='store_true', help='Delete all cached search results before running')
     args = parser.parse_args()
     
     try:
-        if args.input:
-            paths = process_file(args.input, sheet_name=args.sheet, input_col=args.col,
-                               out_dir=args.out, start_row=args.start_row, max_rows=args.max_rows)
+        set_fetch_mode(args.fetch_mode)
+        if args.parallel_variants:
+            set_parallel_variants(True, workers=args.workers)
+        if args.no_pipeline:
+            set_pipeline(False)
+        if args.metrics:
+            metrics.enable(profile_every=args.profile_every)
+        if args.purge_cache:
+            get_cache().purge()
+            logging.info("Search cache purged")
+        if args.no_cache:
+            disable_cache()
+        if args.no_catalog:
+            disable_catalog()
+        if args.stream and args.combined:
+            parser.error('--combined cannot be combined with --stream')
+        if args.input or args.reprice:
+            from excel_utils import set_output
+            set_output(fmt=args.format, workers=args.write_workers, combined=args.combined or '')
+        if args.reprice:
+            from reprice import reprice_files
+            paths = reprice_files(args.reprice, lambda q: kaspi_values(process_query(q)), input_col=args.col,
+                                  out_dir=args.out, workers=args.workers)
+            print('Output files:', paths)
+        elif args.serve:
+            serve_queries(host=args.host, port=args.port, workers=args.workers,
+                          warm_browser=args.fetch_mode == 'browser')
+        elif args.input and args.shards is not None:
+            if args.stream:
+                parser.error('--shards cannot be combined with --stream')
+            settings = {'fetch_mode': args.fetch_mode, 'cache': not args.no_cache, 'catalog': not args.no_catalog,
+                        'parallel_variants': args.parallel_variants, 'pipeline': not args.no_pipeline,
+                        'metrics': args.metrics,
+                        'profile_every': args.profile_every}
+            paths = process_file_sharded(args.input, sheet_name=args.sheet, input_col=args.col,
+                                         out_dir=args.out, start_row=args.start_row, max_rows=args.max_rows,
+                                         workers=args.workers, resume=args.resume,
+                                         shards=args.shards or None, settings=settings)
+            print('Output files:', paths)
+        elif args.input:
+            run = process_file_streaming if args.stream else process_file
+            paths = run(args.input, sheet_name=args.sheet, input_col=args.col,
+                        out_dir=args.out, start_row=args.start_row, max_rows=args.max_rows,
+                        workers=args.workers, resume=args.resume)
             print('Output files:', paths)
         else:
             # Извлекаем характеристики для фильтров
             specs = extract_specs(args.query)
             logging.info(f"Extracted specs: {specs}")
             
-            proxy = random.choice(PROXIES) if PROXIES else None
-            candidates = fetch_search_results(args.query, proxy=proxy, specs=specs)
+            candidates = search_products(args.query, specs=specs)
             
             if candidates:
                 logging.info(f"Found {len(candidates)} products")
@@ -178,5 +950,9 @@ if __name__ == '__main__':
                 
     except Exception as e:
         print('Error:', e)
-        import sys
-        sys.exit(1)
\ No newline at end of file
+        sys.exit(1)
+    finally:
+        if args.metrics:
+            logging.info(f"Metrics written to {metrics.write_report(args.metrics)}")
+        if args.profile_startup:
+            print('\n'.join(startup.report(total=time.perf_counter() - _started)), file=sys.stderr)
\ No newline at end of file
@@ -1,16 +1,21 @@
 from rapidfuzz import fuzz, process
 from collections import defaultdict
+import numpy as np
 import re
+from memo import memoize
+from filters import extract_specs
+import metrics
 
-# Кэш для обработанных названий
-_processed_titles = {}
-_brand_models = {}
+# Характеристики, сравниваемые между запросом и названием кандидата
+SPEC_MATCH_KEYS = ('ram', 'storage', 'processor', 'graphics', 'screen_size')
+# Несовпадение этих характеристик исключает кандидата (8GB вместо 16GB - другой товар)
+SPEC_CONFLICT_KEYS = ('ram', 'storage')
+# Текстовые метрики; их сумма весов - масштаб оценки, specs только перераспределяет веса
+TEXT_METRIC_KEYS = ('title', 'brand', 'model', 'ngram', 'token_sort')
 
+@memoize('preprocess_text')
 def preprocess_text(text):
     """Предварительная обработка текста"""
-    if text in _processed_titles:
-        return _processed_titles[text]
-    
     # Приведение к нижнему регистру и базовая очистка
     text = text.lower().strip()
     
@@ -25,14 +30,11 @@ def preprocess_text(text):
     # Нормализация пробелов
     text = ' '.join(text.split())
     
-    _processed_titles[text] = text
     return text
 
+@memoize('extract_brand_model')
 def extract_brand_model(title):
     """Извлекает бренд и модель из названия товара"""
-    if title in _brand_models:
-        return _brand_models[title]
-    
     words = preprocess_text(title).split()
     if not words:
         return '', ''
@@ -48,28 +50,66 @@ def extract_brand_model(title):
     
     model = ' '.join(model_words) if model_words else ''
     
-    result = (brand, model)
-    _brand_models[title] = result
-    return result
+    return (brand, model)
+
+def _spec_number(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+@memoize('spec_values')
+def spec_values(title):
+    """Нормализованные характеристики названия для сравнения: кортеж по SPEC_MATCH_KEYS, None - нет значения."""
+    specs = extract_specs(str(title or ''))
+    storage = _spec_number(specs['storage'])
+    # Шаблон объема диска отбрасывает единицы: маленькие числа - терабайты
+    if storage is not None and storage < 16:
+        storage *= 1024
+    ram = _spec_number(specs['ram'])
+    # Первое "N GB" в названии может оказаться объемом диска, а не памятью
+    if ram is not None and (ram > 128 or ram == storage):
+        ram = None
+    graphics = re.search(r'\d+', specs['graphics'] or '')
+    processor = specs['processor']
+    return (
+        ram,
+        storage,
+        processor.lower() if processor else None,
+        graphics.group(0) if graphics else None,
+        specs['screen_size'],
+    )
+
+def spec_similarity(source_specs, candidate_specs):
+    """Доля совпавших характеристик среди известных у обоих, 0-100; None - сравнивать нечего."""
+    comparable = matches = 0
+    for source_value, candidate_value in zip(source_specs, candidate_specs):
+        if source_value is not None and candidate_value is not None:
+            comparable += 1
+            matches += source_value == candidate_value
+    return 100 * matches / comparable if comparable else None
 
 def get_category_weights(category):
     """Возвращает веса для конкретной категории товаров"""
     # Можно настроить разные веса для разных категорий
+    # specs учитывается, только если у запроса и кандидата есть общие характеристики
     weights = defaultdict(lambda: {
         'title': 0.5,
         'brand': 0.3,
         'model': 0.2,
         'ngram': 0.1,
-        'token_sort': 0.2
+        'token_sort': 0.2,
+        'specs': 0.2
     })
     
-    # Специальные веса для электроники (где модель важнее)
+    # Специальные веса для электроники (где модель и характеристики важнее)
     weights['электроника'] = {
         'title': 0.4,
         'brand': 0.3,
         'model': 0.3,
         'ngram': 0.2,
-        'token_sort': 0.2
+        'token_sort': 0.2,
+        'specs': 0.3
     }
     
     return weights.get(category.lower(), weights['default'])
@@ -79,6 +119,10 @@ def score_match(source_title, candidate):
     if not source_title or not candidate or not candidate.get('title'):
         return 0
     
+    # Характеристики берутся из исходных названий: шаблонам нужны регистр и кавычки
+    source_specs = spec_values(source_title)
+    candidate_specs = spec_values(candidate.get('title', ''))
+    
     # Предварительная обработка текста
     source_title = preprocess_text(source_title)
     candidate_title = preprocess_text(candidate.get('title', ''))
@@ -100,8 +144,15 @@ def score_match(source_title, candidate):
         'token_sort': fuzz.token_sort_ratio(source_title, candidate_title)  # Учитывает порядок слов
     }
     
-    # Расчет взвешенного счета
-    score = sum(weights[key] * metrics[key] for key in metrics)
+    # Совпадение характеристик (память, диск, процессор, видеокарта, диагональ)
+    specs = spec_similarity(source_specs, candidate_specs)
+    if specs is not None:
+        metrics['specs'] = specs
+    
+    # Расчет взвешенного счета: среднее по использованным метрикам в масштабе текстовых весов,
+    # поэтому совпавшие характеристики повышают оценку, а несовпавшие - понижают
+    scale = sum(weights[key] for key in TEXT_METRIC_KEYS)
+    score = sum(weights[key] * metrics[key] for key in metrics) / sum(weights[key] for key in metrics) * scale
     
     # Штрафы и бонусы
     if category:
@@ -115,18 +166,123 @@ def score_match(source_title, candidate):
     
     return score
 
+# Метрики матрицы оценок: (ключ веса, scorer rapidfuzz, сравниваемое поле)
+_MATRIX_METRICS = [
+    ('title', fuzz.token_set_ratio, 'title'),
+    ('brand', fuzz.ratio, 'brand'),
+    ('model', fuzz.ratio, 'model'),
+    ('ngram', fuzz.QRatio, 'title'),
+    ('token_sort', fuzz.token_sort_ratio, 'title'),
+]
+
+# Начиная с такого числа пар сравнения cdist распараллеливается на все ядра
+_PARALLEL_PAIRS = 20000
+
+def _title_features(titles):
+    """Нормализованные названия, бренды, модели и характеристики для списка названий."""
+    processed = [preprocess_text(t) if t else '' for t in titles]
+    brand_models = [extract_brand_model(t) for t in processed]
+    return {
+        'title': processed,
+        'brand': [b for b, _ in brand_models],
+        'model': [m for _, m in brand_models],
+        # Характеристики - из исходных названий: шаблонам нужны регистр и кавычки
+        'specs': [spec_values(t) for t in titles],
+    }
+
+def _spec_comparison(source_specs, cand_specs, keys=SPEC_MATCH_KEYS):
+    """Матрицы (число совпавших, число сравнимых) характеристик по парам источник x кандидат."""
+    matches = np.zeros((len(source_specs), len(cand_specs)), dtype=np.int64)
+    comparable = np.zeros_like(matches)
+    for key in keys:
+        i = SPEC_MATCH_KEYS.index(key)
+        source = np.array([s[i] for s in source_specs], dtype=object)
+        cand = np.array([c[i] for c in cand_specs], dtype=object)
+        both = np.array([v is not None for v in source])[:, None] & np.array([v is not None for v in cand])[None, :]
+        comparable += both
+        matches += both & (source[:, None] == cand[None, :])
+    return matches, comparable
+
+def spec_conflict_matrix(source_titles, candidates):
+    """Матрица противоречий по SPEC_CONFLICT_KEYS (память, диск) для всех пар (источник x кандидат)."""
+    source = [spec_values(t) for t in source_titles]
+    cand = [spec_values(c.get('title') if c else '') for c in candidates]
+    matches, comparable = _spec_comparison(source, cand, keys=SPEC_CONFLICT_KEYS)
+    return matches < comparable
+
+def score_matrix(source_titles, candidates, workers=None):
+    """Оценки score_match сразу для всех пар (источник x кандидат) в виде NumPy-матрицы."""
+    scores = np.zeros((len(source_titles), len(candidates)), dtype=np.float64)
+    if not len(source_titles) or not len(candidates):
+        return scores
+    if workers is None:
+        workers = -1 if len(source_titles) * len(candidates) >= _PARALLEL_PAIRS else 1
+    
+    # Признаки источников и кандидатов считаются один раз
+    source = _title_features(source_titles)
+    cand = _title_features([c.get('title', '') if c else '' for c in candidates])
+    categories = [(c.get('category', '') or '').lower() if c else '' for c in candidates]
+    
+    # Веса категорий как векторы по кандидатам
+    category_weights = {category: get_category_weights(category) for category in set(categories)}
+    
+    for key, scorer, field in _MATRIX_METRICS:
+        weights = np.array([category_weights[category][key] for category in categories])
+        metric = process.cdist(source[field], cand[field], scorer=scorer, dtype=np.float64, workers=workers)
+        scores += metric * weights
+    
+    # Характеристики: только для пар, где есть что сравнивать; сумма весов нормируется как в score_match
+    matches, comparable = _spec_comparison(source['specs'], cand['specs'])
+    spec_weights = np.array([category_weights[category]['specs'] for category in categories])[None, :] * (comparable > 0)
+    similarity = np.divide(100 * matches, comparable, out=np.zeros(scores.shape), where=comparable > 0)
+    scale = np.array([sum(category_weights[category][key] for key in TEXT_METRIC_KEYS) for category in categories])
+    scores = (scores + similarity * spec_weights) / (scale[None, :] + spec_weights) * scale[None, :]
+    
+    # Штрафы и бонусы применяются только к кандидатам с категорией
+    has_category = np.array([bool(category) for category in categories])
+    not_heater = np.array(['водонагреватель' not in category for category in categories])
+    source_heater = np.array([b.lower() in ['водонагреватель'] for b in source['brand']])
+    penalty = source_heater[:, None] & (has_category & not_heater)[None, :]
+    scores[penalty] *= 0.5
+    
+    same_brand = np.array(source['brand'], dtype=object)[:, None] == np.array(cand['brand'], dtype=object)[None, :]
+    same_model = np.array(source['model'], dtype=object)[:, None] == np.array(cand['model'], dtype=object)[None, :]
+    bonus = same_brand & same_model & has_category[None, :]
+    scores[bonus] = np.minimum(100, scores[bonus] * 1.2)
+    
+    # Пустые названия не сравниваются
+    valid_source = np.array([bool(t) for t in source_titles])
+    valid_cand = np.array([bool(c and c.get('title')) for c in candidates])
+    scores[~valid_source, :] = 0
+    scores[:, ~valid_cand] = 0
+    return scores
+
 def choose_best_candidate(source_title, candidates, topn=5):
     """Выбор лучших кандидатов с учетом всех параметров"""
     if not candidates:
         return []
+    return choose_best_candidates([source_title], candidates, topn=topn)[0]
+
+@metrics.timed('score')
+def choose_best_candidates(source_titles, candidates, topn=5, workers=None):
+    """Лучшие кандидаты для нескольких названий за один расчет матрицы оценок."""
+    if not candidates:
+        return [[] for _ in source_titles]
+    scores = score_matrix(source_titles, candidates, workers=workers)
+    conflicts = spec_conflict_matrix(source_titles, candidates)
     
-    scored = []
-    for cand in candidates:
-        cand_score = score_match(source_title, cand)
-        cand_copy = cand.copy()
-        cand_copy['_score'] = cand_score
-        scored.append(cand_copy)
-    
-    # Сортируем по убыванию оценки
-    scored.sort(key=lambda x: x.get('_score', 0), reverse=True)
-    return scored[:topn]
\ No newline at end of file
+    results = []
+    for row, conflict in zip(scores, conflicts):
+        # Сортируем по убыванию оценки (стабильно, как list.sort) и копируем только topn;
+        # кандидаты с другой памятью или диском отбрасываются, если есть без противоречий
+        order = np.argsort(-row, kind='stable')
+        if not conflict.all():
+            order = order[~conflict[order]]
+        order = order[:topn]
+        scored = []
+        for i in order:
+            cand_copy = candidates[i].copy()
+            cand_copy['_score'] = float(row[i])
+            scored.append(cand_copy)
+        results.append(scored)
+    return results
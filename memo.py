@@ -0,0 +1,47 @@
+import functools
+from config import MEMO_CACHE_SIZE
+
+# Все мемоизированные функции процесса: имя -> функция с lru_cache
+_registry = {}
+
+def memoize(name, maxsize=MEMO_CACHE_SIZE, copy=None):
+    """LRU-мемоизация по аргументам вызова с ограниченной емкостью.
+
+    copy - функция копирования результата (например dict) для изменяемых значений,
+    чтобы вызывающий код не портил закэшированный объект.
+    """
+    def decorator(func):
+        cached = functools.lru_cache(maxsize=maxsize)(func)
+
+        if copy is None:
+            wrapper = cached
+        else:
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                return copy(cached(*args, **kwargs))
+            wrapper.cache_info = cached.cache_info
+            wrapper.cache_clear = cached.cache_clear
+
+        _registry[name] = cached
+        return wrapper
+    return decorator
+
+def stats():
+    """Статистика кэшей: попадания, промахи, размер и доля попаданий."""
+    result = {}
+    for name, cached in _registry.items():
+        info = cached.cache_info()
+        total = info.hits + info.misses
+        result[name] = {
+            'hits': info.hits,
+            'misses': info.misses,
+            'size': info.currsize,
+            'maxsize': info.maxsize,
+            'hit_rate': round(info.hits / total, 3) if total else 0.0,
+        }
+    return result
+
+def clear():
+    """Очистка всех кэшей (например, между независимыми запусками в одном процессе)."""
+    for cached in _registry.values():
+        cached.cache_clear()
@@ -0,0 +1,210 @@
+import cProfile
+import csv
+import functools
+import io
+import json
+import pstats
+import random
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager, nullcontext
+
+# Границы корзин гистограммы длительностей, секунды
+BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, float('inf'))
+# Сколько замеров на метрику хранится для перцентилей (reservoir sampling)
+RESERVOIR_SIZE = 10000
+
+_enabled = False
+_lock = threading.Lock()
+_histograms = {}
+_counters = defaultdict(int)
+_NOOP = nullcontext()
+
+# Выборочное профилирование строк cProfile
+_profile_every = 0
+_profile_seen = 0
+_profile_lock = threading.Lock()
+_profile_stats = None
+
+class _Histogram:
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.buckets = [0] * len(BUCKETS)
+        self.samples = []
+
+    def add(self, seconds):
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+        for i, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                self.buckets[i] += 1
+                break
+        if len(self.samples) < RESERVOIR_SIZE:
+            self.samples.append(seconds)
+        else:
+            j = random.randrange(self.count)
+            if j < RESERVOIR_SIZE:
+                self.samples[j] = seconds
+
+    def summary(self):
+        samples = sorted(self.samples)
+
+        def pct(q):
+            return round(samples[min(len(samples) - 1, int(q * len(samples)))], 6) if samples else None
+
+        return {
+            'count': self.count,
+            'total_s': round(self.total, 6),
+            'mean_s': round(self.total / self.count, 6) if self.count else None,
+            'p50_s': pct(0.5),
+            'p95_s': pct(0.95),
+            'max_s': round(self.max, 6),
+            'buckets': {('inf' if b == float('inf') else str(b)): n for b, n in zip(BUCKETS, self.buckets)},
+        }
+
+def enable(profile_every=0):
+    """Включает сбор метрик; profile_every=N - профилировать cProfile каждую N-ю строку."""
+    global _enabled, _profile_every
+    _enabled = True
+    _profile_every = max(0, int(profile_every or 0))
+
+def enabled():
+    return _enabled
+
+def reset():
+    global _profile_seen, _profile_stats
+    with _lock:
+        _histograms.clear()
+        _counters.clear()
+    _profile_seen = 0
+    _profile_stats = None
+
+def observe(name, seconds):
+    """Добавляет замер длительности в гистограмму метрики."""
+    if not _enabled:
+        return
+    with _lock:
+        histogram = _histograms.get(name)
+        if histogram is None:
+            histogram = _histograms[name] = _Histogram()
+        histogram.add(seconds)
+
+def count(name, n=1):
+    if not _enabled:
+        return
+    with _lock:
+        _counters[name] += n
+
+class _Timer:
+    __slots__ = ('name', 'start')
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        observe(self.name, time.perf_counter() - self.start)
+        return False
+
+def timer(name):
+    """Контекстный менеджер замера стадии; при выключенных метриках - общий пустой контекст."""
+    return _Timer(name) if _enabled else _NOOP
+
+def timed(name):
+    """Декоратор замера длительности вызова функции."""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return func(*args, **kwargs)
+            with _Timer(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def profile_sampled():
+    """Попадает ли очередная строка в выборку профилирования (каждая profile_every-я)."""
+    global _profile_seen
+    if not _enabled or not _profile_every:
+        return False
+    with _lock:
+        _profile_seen += 1
+        return _profile_seen % _profile_every == 0
+
+@contextmanager
+def profile_section():
+    """Профилирует блок cProfile в текущем потоке и добавляет его к общей статистике.
+    Одновременно профилируется один блок; выдает True, если этот блок попал в профиль."""
+    global _profile_stats
+    if not _profile_lock.acquire(blocking=False):
+        yield False
+        return
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+        try:
+            yield True
+        finally:
+            profiler.disable()
+            with _lock:
+                if _profile_stats is None:
+                    _profile_stats = pstats.Stats(profiler, stream=io.StringIO())
+                else:
+                    _profile_stats.add(profiler)
+    finally:
+        _profile_lock.release()
+
+@contextmanager
+def maybe_profile():
+    """Профилирует текущую строку cProfile, если она попала в выборку (одна строка за раз)."""
+    if not profile_sampled():
+        yield
+        return
+    with profile_section() as profiling:
+        yield
+    if profiling:
+        count('profile.rows')
+
+def profiled(func):
+    """Декоратор: вызов попадает в выборку профилирования maybe_profile."""
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if not _enabled or not _profile_every:
+            return func(*args, **kwargs)
+        with maybe_profile():
+            return func(*args, **kwargs)
+    return wrapper
+
+def snapshot():
+    """Все метрики: гистограммы длительностей и счетчики."""
+    with _lock:
+        return {
+            'timings': {name: h.summary() for name, h in sorted(_histograms.items())},
+            'counters': dict(sorted(_counters.items())),
+        }
+
+def write_report(prefix):
+    """Пишет отчет запуска: <prefix>.json, <prefix>.csv и <prefix>.prof (если было профилирование).
+    Возвращает список путей."""
+    data = snapshot()
+    paths = [f"{prefix}.json", f"{prefix}.csv"]
+    with open(paths[0], 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+    with open(paths[1], 'w', encoding='utf-8', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['metric', 'count', 'total_s', 'mean_s', 'p50_s', 'p95_s', 'max_s'])
+        for name, s in data['timings'].items():
+            writer.writerow([name, s['count'], s['total_s'], s['mean_s'], s['p50_s'], s['p95_s'], s['max_s']])
+        for name, value in data['counters'].items():
+            writer.writerow([name, value, '', '', '', '', ''])
+    if _profile_stats is not None:
+        paths.append(f"{prefix}.prof")
+        _profile_stats.dump_stats(paths[-1])
+    return paths
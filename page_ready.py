@@ -0,0 +1,155 @@
+import json
+import logging
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from config import READY_TIMEOUT, READY_SETTLE
+import metrics
+
+CARD_SELECTOR = 'div.item-card'
+POLL_INTERVAL = 0.1
+# Запросы дольше этого (long-polling, аналитика) не мешают считать сеть простаивающей
+LONG_REQUEST = 5.0
+
+# По скольким последним ожиданиям шага считается медиана (память не растет в долгоживущем сервисе)
+WAIT_WINDOW = 1000
+
+class _WaitStats:
+    """Число, сумма и максимум ожиданий шага за все время и последние WAIT_WINDOW длительностей."""
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.recent = deque(maxlen=WAIT_WINDOW)
+
+    def add(self, seconds):
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+        self.recent.append(seconds)
+
+# Ожидания по шагам: имя шага -> _WaitStats
+_wait_times = defaultdict(_WaitStats)
+_wait_lock = threading.Lock()
+
+@contextmanager
+def timed_wait(name):
+    """Замеряет длительность ожидания и сохраняет ее в статистику шага."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        with _wait_lock:
+            _wait_times[name].add(elapsed)
+        metrics.observe(f"wait.{name}", elapsed)
+
+def wait_stats():
+    """Статистика ожиданий: количество, среднее и максимум по каждому шагу, медиана - по последним WAIT_WINDOW."""
+    with _wait_lock:
+        snapshot = {name: (stats.count, stats.total, stats.max, list(stats.recent))
+                    for name, stats in _wait_times.items() if stats.count}
+    result = {}
+    for name, (count, total, longest, recent) in snapshot.items():
+        recent.sort()
+        result[name] = {
+            'count': count,
+            'mean': round(total / count, 3),
+            'p50': round(recent[len(recent) // 2], 3),
+            'max': round(longest, 3),
+        }
+    return result
+
+class _NetworkTracker:
+    """Отслеживает незавершенные запросы по CDP-событиям из performance-лога Chrome."""
+
+    def __init__(self, driver):
+        self.driver = driver
+        self.inflight = {}
+        self.last_activity = time.monotonic()
+        self.available = True
+
+    def poll(self):
+        from selenium.common.exceptions import WebDriverException
+        try:
+            entries = self.driver.get_log('performance')
+        except WebDriverException:
+            # Performance-лог не включен в этом драйвере
+            self.available = False
+            return
+        now = time.monotonic()
+        for entry in entries:
+            try:
+                message = json.loads(entry['message'])['message']
+            except (KeyError, ValueError):
+                continue
+            method = message.get('method', '')
+            request_id = message.get('params', {}).get('requestId')
+            if method == 'Network.requestWillBeSent':
+                self.inflight[request_id] = now
+                self.last_activity = now
+            elif method in ('Network.loadingFinished', 'Network.loadingFailed'):
+                self.inflight.pop(request_id, None)
+                self.last_activity = now
+
+    def idle(self, quiet):
+        if not self.available:
+            return True
+        now = time.monotonic()
+        active = [rid for rid, started in self.inflight.items() if now - started < LONG_REQUEST]
+        return not active and now - self.last_activity >= quiet
+
+def wait_results_ready(driver, timeout=READY_TIMEOUT, settle=READY_SETTLE, step='results'):
+    """Ждет, пока выдача готова: число карточек не меняется settle секунд
+    и либо карточки есть, либо страница загружена и сеть простаивает (пустая выдача).
+    Возвращает число карточек."""
+    # Selenium загружается только в режиме браузера
+    from selenium.webdriver.common.by import By
+    from selenium.common.exceptions import WebDriverException
+    with timed_wait(step):
+        network = _NetworkTracker(driver)
+        deadline = time.monotonic() + timeout
+        last_count = -1
+        stable_since = time.monotonic()
+        while True:
+            now = time.monotonic()
+            try:
+                count = len(driver.find_elements(By.CSS_SELECTOR, CARD_SELECTOR))
+            except WebDriverException:
+                count = 0
+            network.poll()
+            if count != last_count:
+                last_count = count
+                stable_since = now
+            elif now - stable_since >= settle:
+                if count > 0 and network.idle(settle / 2):
+                    return count
+                if count == 0 and network.idle(settle) and \
+                        driver.execute_script("return document.readyState") == 'complete':
+                    return count
+            if now >= deadline:
+                logging.warning(f"Page readiness timeout ({step}) after {timeout}s, {count} cards")
+                return count
+            time.sleep(POLL_INTERVAL)
+
+def first_card(driver):
+    """Первая карточка выдачи (для отслеживания перерисовки) или None."""
+    from selenium.webdriver.common.by import By
+    cards = driver.find_elements(By.CSS_SELECTOR, CARD_SELECTOR)
+    return cards[0] if cards else None
+
+def wait_rerender(driver, old_card, timeout=READY_TIMEOUT, step='filter'):
+    """Ждет перерисовки выдачи после клика по фильтру: старая карточка исчезает из DOM,
+    затем новая выдача стабилизируется."""
+    from selenium.webdriver.support.ui import WebDriverWait
+    from selenium.webdriver.support import expected_conditions as EC
+    from selenium.common.exceptions import TimeoutException
+    if old_card is not None:
+        with timed_wait(f"{step}_stale"):
+            try:
+                WebDriverWait(driver, timeout, poll_frequency=POLL_INTERVAL).until(EC.staleness_of(old_card))
+            except TimeoutException:
+                logging.warning(f"Results did not re-render after {step} within {timeout}s")
+    return wait_results_ready(driver, timeout=timeout, step=step)
@@ -0,0 +1,157 @@
+"""Конвейер стадий на потоках: у каждой стадии свое число потоков и входная очередь ограниченного размера.
+
+Стадия - функция func(item) -> имя следующей стадии или DONE. Передача вперед ждет места
+в очереди (обратное давление: быстрая стадия не убегает от медленной), передача назад
+(повтор, например следующий вариант поиска) ставится в начало очереди без ожидания.
+Пропускная способность ограничена самой медленной стадией, а не суммой всех.
+Готовые элементы попадают в очередь своей порции (Batch), которую читает вызывающий поток.
+"""
+import logging
+import queue
+import threading
+import time
+from config import PIPELINE_QUEUE_SIZE
+import metrics
+
+# Маршрут стадии: элемент готов и уходит на выход конвейера
+DONE = None
+_STOP = object()
+
+class _StageQueue(queue.Queue):
+    def put_retry(self, item):
+        """В начало очереди и без ожидания места. Повтор идет против потока: поток поздней стадии
+        не должен ждать места у ранней, которая сама может ждать его (иначе взаимная блокировка)."""
+        with self.mutex:
+            self.queue.appendleft(item)
+            self.unfinished_tasks += 1
+            self.not_empty.notify()
+
+class Stage:
+    def __init__(self, name, func, workers=1):
+        self.name = name
+        self.func = func
+        self.workers = max(1, int(workers))
+        self.items = 0
+        self.busy = 0.0
+        self.blocked = 0.0
+
+class Batch:
+    """Порция элементов в конвейере: готовые элементы собираются в ее собственную очередь."""
+
+    def __init__(self, items):
+        self.items = list(items)
+        self.output = queue.Queue()
+
+    def results(self):
+        """Выдает (элемент, исключение стадии или None) для каждого элемента порции в порядке готовности."""
+        for _ in range(len(self.items)):
+            yield self.output.get()
+
+class Pipeline:
+    """Стадии по порядку. Потоки стадий запускаются один раз и живут до close(), поэтому
+    порции (submit) идут через одни и те же потоки, соединения и браузеры, а следующая порция
+    может войти в конвейер, пока предыдущая еще догружается."""
+
+    def __init__(self, stages, queue_size=PIPELINE_QUEUE_SIZE):
+        self.stages = list(stages)
+        self._index = {stage.name: i for i, stage in enumerate(self.stages)}
+        self._queues = [_StageQueue(maxsize=max(1, int(queue_size))) for _ in self.stages]
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._threads = []
+
+    def _put(self, target, item):
+        """Ждет места в очереди, пока конвейер не останавливают."""
+        while not self._stopping.is_set():
+            try:
+                target.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def _route(self, i, route, entry):
+        if route is DONE:
+            entry[0].output.put((entry[1], None))
+            return
+        j = self._index[route]
+        if j > i:
+            self._put(self._queues[j], entry)
+        else:
+            self._queues[j].put_retry(entry)
+
+    def _work(self, i):
+        stage = self.stages[i]
+        inbox = self._queues[i]
+        while True:
+            entry = inbox.get()
+            if entry is _STOP:
+                return
+            batch, item = entry
+            started = time.perf_counter()
+            try:
+                route = stage.func(item)
+            except Exception as e:
+                logging.error(f"Pipeline stage '{stage.name}' failed: {e}")
+                batch.output.put((item, e))
+                route = _STOP
+            elapsed = time.perf_counter() - started
+            metrics.observe(f"stage.{stage.name}", elapsed)
+            if route is not _STOP:
+                self._route(i, route, entry)
+            with self._lock:
+                stage.items += 1
+                stage.busy += elapsed
+                stage.blocked += time.perf_counter() - started - elapsed
+
+    def start(self):
+        """Запускает потоки стадий (повторный вызов ничего не делает)."""
+        with self._lock:
+            if self._threads:
+                return
+            self._threads = [threading.Thread(target=self._work, args=(i,), name=f"{stage.name}-{k}", daemon=True)
+                             for i, stage in enumerate(self.stages) for k in range(stage.workers)]
+        for thread in self._threads:
+            thread.start()
+
+    def _feed(self, batch):
+        for item in batch.items:
+            if self._stopping.is_set():
+                return
+            self._put(self._queues[0], (batch, item))
+
+    def submit(self, items):
+        """Ставит порцию в конвейер и сразу возвращает ее; элементы подаются отдельным потоком,
+        с обратным давлением первой очереди."""
+        self.start()
+        batch = Batch(items)
+        threading.Thread(target=self._feed, args=(batch,), name='feed', daemon=True).start()
+        return batch
+
+    def run(self, items):
+        """submit и ожидание всей порции: (элемент, исключение или None) в порядке готовности."""
+        return self.submit(items).results()
+
+    def close(self):
+        """Останавливает потоки стадий; элементы, еще не дошедшие до выхода, отбрасываются."""
+        self._stopping.set()
+        with self._lock:
+            threads, self._threads = self._threads, []
+        for i, stage in enumerate(self.stages):
+            for _ in range(stage.workers if threads else 0):
+                self._queues[i].put_retry(_STOP)
+        for thread in threads:
+            thread.join()
+
+    def stats(self):
+        """Нагрузка стадий: самая загруженная (busy на поток) ограничивает пропускную способность."""
+        with self._lock:
+            return {
+                stage.name: {
+                    'workers': stage.workers,
+                    'items': stage.items,
+                    'busy_s': round(stage.busy, 3),
+                    'busy_per_worker_s': round(stage.busy / stage.workers, 3),
+                    'blocked_s': round(stage.blocked, 3),
+                }
+                for stage in self.stages
+            }
@@ -0,0 +1,207 @@
+import logging
+import random
+import threading
+import time
+from config import PROXIES, MIN_DELAY, MAX_DELAY, PROXY_RATE, PROXY_DIRECT_RATE, PROXY_BURST, PROXY_MAX_FAILURES, \
+    PROXY_COOLDOWN, PROXY_MAX_COOLDOWN, PROXY_DIRECT_COOLDOWN, PROXY_RETRY_AFTER
+
+# Вес новой задержки в скользящем среднем
+LATENCY_ALPHA = 0.3
+# Сколько слотов помнить, прежде чем выбросить тех, чья пауза уже прошла
+SLOT_LIMIT = 1024
+
+def retry_after_seconds(value, default=PROXY_RETRY_AFTER):
+    """Секунды из заголовка Retry-After (число или HTTP-дата); default, если заголовка нет или он не разбирается."""
+    if not value:
+        return default
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    try:
+        from email.utils import parsedate_to_datetime
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return default
+
+class _ProxyState:
+    def __init__(self, proxy, burst):
+        self.proxy = proxy
+        self.tokens = float(burst)
+        self.refilled_at = time.monotonic()
+        self.next_allowed = 0.0
+        self.failures = 0
+        self.ejections = 0
+        self.ejected_until = 0.0
+        self.latency = None
+        self.requests = 0
+        self.errors = 0
+
+class ProxyScheduler:
+    """Планировщик прокси: token bucket на каждый прокси, учет ошибок и задержек,
+    временное исключение сбойных прокси.
+
+    Случайная пауза между запросами (min_delay..max_delay) ведется на слот - сессию потока
+    или браузер, - а не на прокси, поэтому воркеры не выстраиваются в одну очередь.
+    Без прокси в списке планируется прямое соединение (None); его token bucket - direct_rate
+    (0 - без ограничения)."""
+
+    def __init__(self, proxies=None, rate=PROXY_RATE, burst=PROXY_BURST, min_delay=MIN_DELAY, max_delay=MAX_DELAY,
+                 max_failures=PROXY_MAX_FAILURES, cooldown=PROXY_COOLDOWN, max_cooldown=PROXY_MAX_COOLDOWN,
+                 direct_cooldown=PROXY_DIRECT_COOLDOWN, direct_rate=PROXY_DIRECT_RATE):
+        self.rate = rate
+        self.direct_rate = direct_rate
+        self.burst = max(1, burst)
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.max_failures = max_failures
+        self.cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self.direct_cooldown = direct_cooldown
+        self._lock = threading.Lock()
+        self._states = {}
+        self._slots = {}
+        self._next_assign = 0
+        for proxy in (list(PROXIES if proxies is None else proxies) or [None]):
+            self._states[proxy] = _ProxyState(proxy, self.burst)
+
+    def _state(self, proxy):
+        state = self._states.get(proxy)
+        if state is None:
+            state = self._states[proxy] = _ProxyState(proxy, self.burst)
+        return state
+
+    def _rate(self, state):
+        return self.direct_rate if state.proxy is None else self.rate
+
+    def _ready_at(self, state, now, slot):
+        """Момент, когда слот может сделать запрос через прокси (токены, пауза слота, 429 и исключение)."""
+        rate = self._rate(state)
+        if rate:
+            state.tokens = min(self.burst, state.tokens + (now - state.refilled_at) * rate)
+            state.refilled_at = now
+            token_wait = 0.0 if state.tokens >= 1 else (1 - state.tokens) / rate
+        else:
+            token_wait = 0.0
+        return max(now + token_wait, self._slots.get(slot, 0.0), state.next_allowed, state.ejected_until)
+
+    def _healthy(self, now):
+        states = [s for s in self._states.values() if s.ejected_until <= now]
+        # Если исключены все, ждем тот, что вернется раньше остальных
+        return states or [min(self._states.values(), key=lambda s: s.ejected_until)]
+
+    def _rank(self, state):
+        latency = state.latency if state.latency is not None else 0.0
+        error_rate = state.errors / state.requests if state.requests else 0.0
+        return latency * (1 + error_rate) + error_rate
+
+    def _take(self, state, now, slot):
+        if self._rate(state):
+            state.tokens -= 1
+        if len(self._slots) >= SLOT_LIMIT:
+            self._slots = {k: t for k, t in self._slots.items() if t > now}
+        self._slots[slot] = now + random.uniform(self.min_delay, self.max_delay)
+        state.requests += 1
+
+    def acquire(self, slot=None):
+        """Ждет и возвращает лучший доступный прокси (None - прямое соединение).
+        slot - кто делает запрос (по умолчанию текущий поток, у которого своя сессия)."""
+        slot = threading.get_ident() if slot is None else slot
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                ready = [(self._ready_at(s, now, slot), self._rank(s), i, s) for i, s in enumerate(self._healthy(now))]
+                ready_at, _, _, state = min(ready, key=lambda r: (max(r[0], now), r[1], r[2]))
+                if ready_at <= now:
+                    self._take(state, now, slot)
+                    return state.proxy
+                wait = ready_at - now
+            time.sleep(wait)
+
+    def acquire_proxy(self, proxy, slot=None):
+        """Ждет, пока слот может сделать запрос через конкретный прокси (например, привязанный к браузеру)."""
+        slot = threading.get_ident() if slot is None else slot
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                state = self._state(proxy)
+                ready_at = self._ready_at(state, now, slot)
+                if ready_at <= now:
+                    self._take(state, now, slot)
+                    return proxy
+                wait = ready_at - now
+            time.sleep(wait)
+
+    def release(self, proxy, ok, latency=None, retry_after=None):
+        """Результат запроса через прокси: обновляет здоровье и при серии ошибок исключает прокси.
+        retry_after - сайт ответил 429: прокси исправен, но пауза на столько секунд (None в заголовке - PROXY_RETRY_AFTER)."""
+        with self._lock:
+            state = self._state(proxy)
+            if latency is not None:
+                state.latency = latency if state.latency is None else \
+                    (1 - LATENCY_ALPHA) * state.latency + LATENCY_ALPHA * latency
+            if retry_after is not None:
+                pause = min(self.max_cooldown, max(0.0, retry_after))
+                state.next_allowed = max(state.next_allowed, time.monotonic() + pause)
+                logging.warning(f"Proxy {proxy or 'direct'} rate limited, pausing for {pause:.0f}s")
+                return
+            if ok:
+                state.failures = 0
+                state.ejections = 0
+                return
+            state.errors += 1
+            state.failures += 1
+            if self.max_failures and state.failures >= self.max_failures:
+                state.failures = 0
+                if proxy is None:
+                    # Прямое соединение заменить нечем: только короткая пауза без удвоения
+                    duration = self.direct_cooldown
+                else:
+                    # Каждое повторное исключение подряд вдвое длиннее, но не дольше max_cooldown
+                    state.ejections += 1
+                    duration = min(self.max_cooldown, self.cooldown * 2 ** (state.ejections - 1))
+                state.ejected_until = time.monotonic() + duration
+                logging.warning(f"Proxy {proxy or 'direct'} ejected for {duration:.0f}s after repeated failures")
+
+    def is_ejected(self, proxy):
+        with self._lock:
+            return self._state(proxy).ejected_until > time.monotonic()
+
+    def assign(self):
+        """Прокси для нового браузера: по кругу среди неисключенных."""
+        with self._lock:
+            states = self._healthy(time.monotonic())
+            state = states[self._next_assign % len(states)]
+            self._next_assign += 1
+            return state.proxy
+
+    def stats(self):
+        with self._lock:
+            now = time.monotonic()
+            return {
+                (s.proxy or 'direct'): {
+                    'requests': s.requests,
+                    'errors': s.errors,
+                    'latency': round(s.latency, 3) if s.latency is not None else None,
+                    'ejected': s.ejected_until > now,
+                }
+                for s in self._states.values()
+            }
+
+# Глобальный планировщик процесса
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+def get_scheduler():
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = ProxyScheduler()
+        return _scheduler
+
+def configure(**kwargs):
+    """Заменяет планировщик процесса новым с указанными параметрами (например, без пауз для стенда)."""
+    global _scheduler
+    with _scheduler_lock:
+        _scheduler = ProxyScheduler(**kwargs)
+        return _scheduler
@@ -0,0 +1,149 @@
+"""Переоценка по прошлому результату: цены обновляются по известным кодам Kaspi
+без поиска и сопоставления; полный поиск - только для ненайденных и исчезнувших товаров.
+
+Запуск: python main.py --reprice output/doc1000_part1.xlsx output/doc1000_part2.xlsx --out ./output
+"""
+import logging
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import requests
+from config import CHUNK_SIZE, MAX_WORKERS
+from kaspi_api import fetch_product
+from catalog import get_catalog
+import metrics
+
+NOT_FOUND = "не найден"
+# Колонки переоценки в выходном файле
+PREVIOUS_PRICE_COLUMN = 'прежняя цена каспи'
+REPRICE_COLUMN = 'переоценка'
+
+UNCHANGED = 'цена не изменилась'
+CHANGED = 'цена изменилась'
+RESEARCHED = 'повторный поиск'
+FAILED = 'не удалось обновить'
+
+_PART_RE = re.compile(r'_part(\d+)$')
+
+def _part_key(path):
+    """Порядок частей выхода: <base>_part1, <base>_part2, ... (номер части числом)."""
+    stem = os.path.splitext(os.path.basename(path))[0]
+    match = _PART_RE.search(stem)
+    return (_PART_RE.sub('', stem), int(match.group(1)) if match else 0)
+
+def read_previous_output(paths):
+    """Прошлый результат из одной или нескольких частей выхода, строки в исходном порядке."""
+    import pandas as pd
+    from excel_utils import read_output
+    frames = [read_output(path) for path in sorted(paths, key=_part_key)]
+    return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+
+def known_product_id(value):
+    """Код Kaspi из колонки 'код каспи' или None для пустых и ненайденных строк."""
+    if value is None or value != value:  # NaN
+        return None
+    text = str(value).strip()
+    if text.endswith('.0'):  # код, прочитанный Excel как число
+        text = text[:-2]
+    return text if text and text != NOT_FOUND else None
+
+def _same_price(old, new):
+    try:
+        return float(old) == new
+    except (TypeError, ValueError):
+        return False
+
+def refresh_prices(product_ids, workers=MAX_WORKERS):
+    """Загружает страницы товаров параллельно: {код: товар, None - товар исчез, исключение - ошибка}."""
+    products = {}
+    with ThreadPoolExecutor(max_workers=max(1, int(workers))) as executor:
+        futures = {executor.submit(fetch_product, product_id): product_id for product_id in product_ids}
+        for future in as_completed(futures):
+            product_id = futures[future]
+            try:
+                products[product_id] = future.result()
+            except requests.RequestException as e:
+                logging.warning(f"Could not refresh product {product_id}: {e}")
+                products[product_id] = e
+    return products
+
+def reprice(df, search, input_col='Номенклатура поставщика', workers=MAX_WORKERS):
+    """Обновляет 'цена каспи' по кодам Kaspi и отмечает изменения в колонке REPRICE_COLUMN.
+
+    search(query) -> (код, цена, статус) - полный поиск для строк без кода или с исчезнувшим товаром."""
+    if 'код каспи' not in df.columns:
+        raise KeyError(f"Column 'код каспи' not found in previous output. Columns: {df.columns.tolist()}")
+    if input_col not in df.columns:
+        raise KeyError(f"Column '{input_col}' not found in previous output. Columns: {df.columns.tolist()}")
+    out_df = df.copy()
+    if 'цена каспи' not in out_df.columns:
+        out_df['цена каспи'] = None
+    if 'статус поиска' not in out_df.columns:
+        out_df['статус поиска'] = None
+    out_df[PREVIOUS_PRICE_COLUMN] = out_df['цена каспи']
+    out_df['код каспи'] = out_df['код каспи'].astype(object)
+    out_df['статус поиска'] = out_df['статус поиска'].astype(object)
+
+    ids = [known_product_id(value) for value in out_df['код каспи']]
+    distinct = sorted({product_id for product_id in ids if product_id})
+    logging.info(f"Repricing {len(distinct)} known products for {sum(1 for i in ids if i)} of {len(ids)} rows")
+    products = refresh_prices(distinct, workers=workers)
+
+    catalog = get_catalog()
+    if catalog is not None:
+        catalog.add_products([p for p in products.values() if isinstance(p, dict) and p.get('title')])
+
+    research = []
+    prices = out_df['цена каспи'].tolist()
+    flags = [None] * len(ids)
+    for row, product_id in enumerate(ids):
+        product = products.get(product_id) if product_id else None
+        if isinstance(product, Exception):
+            # Ошибка сети: прежняя цена остается, строка помечается
+            flags[row] = FAILED
+        elif product is None:
+            research.append(row)
+        else:
+            flags[row] = UNCHANGED if _same_price(prices[row], product['price']) else CHANGED
+            prices[row] = product['price']
+    out_df['цена каспи'] = prices
+    out_df[REPRICE_COLUMN] = flags
+    metrics.count('reprice.changed', flags.count(CHANGED))
+    metrics.count('reprice.unchanged', flags.count(UNCHANGED))
+
+    # Полный поиск: одинаковые запросы ищутся один раз
+    queries = out_df[input_col].astype(str).fillna('').tolist()
+    groups = {}
+    for row in research:
+        groups.setdefault(queries[row].strip(), []).append(row)
+    logging.info(f"Searching again for {len(research)} rows ({len(groups)} distinct queries)")
+    with ThreadPoolExecutor(max_workers=max(1, int(workers))) as executor:
+        futures = {executor.submit(search, queries[rows[0]]): rows for rows in groups.values()}
+        for future in as_completed(futures):
+            rows = futures[future]
+            try:
+                values = future.result()
+            except Exception as e:
+                logging.error(f"Failed to search '{queries[rows[0]]}': {e}")
+                values = None
+            for row in rows:
+                if values is None:
+                    out_df.at[row, REPRICE_COLUMN] = FAILED
+                    continue
+                for column, value in zip(('код каспи', 'цена каспи', 'статус поиска'), values):
+                    out_df.at[row, column] = value
+                out_df.at[row, REPRICE_COLUMN] = RESEARCHED
+    metrics.count('reprice.researched', len(research))
+    logging.info(f"Reprice done: {flags.count(CHANGED)} changed, {flags.count(UNCHANGED)} unchanged, "
+                 f"{len(research)} searched again, {flags.count(FAILED)} failed")
+    return out_df
+
+def reprice_files(paths, search, input_col='Номенклатура поставщика', out_dir='./output', workers=MAX_WORKERS):
+    """Переоценка прошлого выхода (все его части) с записью частей <base>_repriced_partN в формате выхода."""
+    from excel_utils import write_output_chunks
+    df = read_previous_output(paths)
+    out_df = reprice(df, search, input_col=input_col, workers=workers)
+    base_name = f"{_part_key(sorted(paths, key=_part_key)[0])[0]}_repriced"
+    paths = write_output_chunks(out_df, out_dir, base_name=base_name, chunk_size=CHUNK_SIZE)
+    logging.info(f"Wrote {len(paths)} files to {out_dir}")
+    return paths
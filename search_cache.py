@@ -0,0 +1,137 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from config import CACHE_PATH, CACHE_TTL, CACHE_MAX_ENTRIES
+from matching import preprocess_text
+
+class SearchCache:
+    """Кэш результатов поиска Kaspi в одном SQLite-файле с TTL и ограничением размера."""
+
+    def __init__(self, path=CACHE_PATH, ttl=CACHE_TTL, max_entries=CACHE_MAX_ENTRIES):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS search_cache (
+                key TEXT PRIMARY KEY,
+                products TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                accessed_at REAL NOT NULL
+            )""")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_search_cache_accessed ON search_cache(accessed_at)")
+        self._conn.commit()
+
+    @staticmethod
+    def make_key(query, specs=None):
+        """Ключ: нормализованный запрос + характеристики в каноническом виде."""
+        normalized = preprocess_text(query or '')
+        specs_part = json.dumps(specs or {}, sort_keys=True, ensure_ascii=False)
+        return f"{normalized}|{specs_part}"
+
+    def get(self, query, specs=None):
+        """Список товаров из кэша или None, если записи нет или она устарела."""
+        key = self.make_key(query, specs)
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT products, created_at FROM search_cache WHERE key = ?", (key,)).fetchone()
+            if row is None or (self.ttl and now - row[1] > self.ttl):
+                if row is not None:
+                    self._conn.execute("DELETE FROM search_cache WHERE key = ?", (key,))
+                    self._conn.commit()
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE search_cache SET accessed_at = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            self.hits += 1
+        return json.loads(row[0])
+
+    def put(self, query, specs, products):
+        """Сохраняет результат поиска и вытесняет давно не использованные записи."""
+        key = self.make_key(query, specs)
+        now = time.time()
+        payload = json.dumps(products, ensure_ascii=False)
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO search_cache (key, products, created_at, accessed_at) VALUES (?, ?, ?, ?)",
+                (key, payload, now, now))
+            self._evict()
+            self._conn.commit()
+
+    def _evict(self):
+        if not self.max_entries:
+            return
+        count = self._conn.execute("SELECT COUNT(*) FROM search_cache").fetchone()[0]
+        excess = count - self.max_entries
+        if excess > 0:
+            self._conn.execute(
+                "DELETE FROM search_cache WHERE key IN "
+                "(SELECT key FROM search_cache ORDER BY accessed_at LIMIT ?)", (excess,))
+            logging.info(f"Search cache: evicted {excess} entries")
+
+    def purge(self):
+        """Полная очистка кэша."""
+        with self._lock:
+            self._conn.execute("DELETE FROM search_cache")
+            self._conn.commit()
+            self._conn.execute("VACUUM")
+
+    def stats(self):
+        with self._lock:
+            size = self._conn.execute("SELECT COUNT(*) FROM search_cache").fetchone()[0]
+        total = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / total, 3) if total else 0.0,
+            'entries': size,
+        }
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+# Глобальный кэш процесса; None - кэш отключен
+_cache = None
+_cache_enabled = True
+_cache_path = CACHE_PATH
+_cache_lock = threading.Lock()
+
+def get_cache():
+    """Возвращает кэш процесса (создается при первом обращении) или None, если он отключен."""
+    global _cache
+    if not _cache_enabled:
+        return None
+    with _cache_lock:
+        if _cache is None:
+            _cache = SearchCache(_cache_path)
+        return _cache
+
+def set_cache_path(path):
+    """Файл кэша процесса (bench_e2e.py держит товары стенда отдельно от настоящих)."""
+    global _cache_path, _cache
+    with _cache_lock:
+        _cache_path = path
+        if _cache is not None:
+            _cache.close()
+            _cache = None
+
+def disable_cache():
+    """Отключает кэш для текущего запуска (--no-cache)."""
+    global _cache_enabled, _cache
+    with _cache_lock:
+        _cache_enabled = False
+        if _cache is not None:
+            _cache.close()
+            _cache = None
@@ -0,0 +1,182 @@
+"""Долгоживущий сервис сопоставления: HTTP/JSON API поверх process_query.
+
+Браузеры, HTTP-сессии, кэши и локальный каталог живут между запросами, поэтому
+одиночный поиск стоит примерно одного обращения к Kaspi.
+
+    POST /match  {"query": "..."}            -> результат строки
+    POST /batch  {"queries": ["...", ...]}   -> {"results": [...]} в порядке запросов
+    GET  /stats                              -> очередь, задержки, кэши, прокси
+    GET  /health                             -> {"status": "ok"}
+
+Запуск: python main.py --serve --port 8765 --workers 5
+"""
+import json
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from config import SERVICE_HOST, SERVICE_PORT, SERVICE_MAX_PENDING, MAX_WORKERS
+
+# Сколько последних задержек запросов хранится для перцентилей /stats
+LATENCY_WINDOW = 1000
+
+class QueueFull(Exception):
+    """В очереди нет места для строк запроса."""
+
+class MatchService:
+    """Очередь строк к process: не больше workers поисков одновременно
+    и не больше max_pending строк в ожидании и в работе.
+    on_error(q, e) - результат строки, поиск которой упал; без него ошибка строки роняет весь запрос."""
+
+    def __init__(self, process, workers=MAX_WORKERS, max_pending=SERVICE_MAX_PENDING, stats=None, on_error=None):
+        self.process = process
+        self.on_error = on_error
+        self.workers = max(1, int(workers))
+        self.max_pending = max(1, int(max_pending))
+        self.extra_stats = stats
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='match')
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._served = 0
+        self._rejected = 0
+        self._latencies = []
+        self.started_at = time.time()
+
+    def _reserve(self, n):
+        with self._lock:
+            if self._pending + n > self.max_pending:
+                self._rejected += 1
+                raise QueueFull(f"{self._pending} rows pending, limit {self.max_pending}")
+            self._pending += n
+
+    def _release(self, n, elapsed):
+        with self._lock:
+            self._pending -= n
+            self._served += n
+            self._latencies.append(elapsed)
+            del self._latencies[:-LATENCY_WINDOW]
+
+    def match_many(self, queries):
+        """Результаты для списка запросов по порядку; одинаковые запросы ищутся один раз."""
+        started = time.perf_counter()
+        self._reserve(len(queries))
+        try:
+            futures = {}
+            for q in queries:
+                key = q.strip()
+                if key not in futures:
+                    futures[key] = self._executor.submit(self.process, q)
+            return [dict(self._result(q, futures[q.strip()]), query=q) for q in queries]
+        finally:
+            self._release(len(queries), time.perf_counter() - started)
+
+    def _result(self, q, future):
+        """Результат строки; сбой одной строки не отменяет остальные строки /batch."""
+        if self.on_error is None:
+            return future.result()
+        try:
+            return future.result()
+        except Exception as e:
+            logging.error(f"Error processing query '{q}': {e}")
+            return self.on_error(q, e)
+
+    def stats(self):
+        with self._lock:
+            latencies = sorted(self._latencies)
+            data = {
+                'uptime_s': round(time.time() - self.started_at, 1),
+                'workers': self.workers,
+                'pending': self._pending,
+                'max_pending': self.max_pending,
+                'served': self._served,
+                'rejected': self._rejected,
+                'latency_p50_s': round(latencies[len(latencies) // 2], 3) if latencies else None,
+                'latency_p95_s': round(latencies[int(len(latencies) * 0.95)], 3) if latencies else None,
+            }
+        if self.extra_stats is not None:
+            data.update(self.extra_stats())
+        return data
+
+    def close(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+class ServiceServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, service, host=SERVICE_HOST, port=SERVICE_PORT):
+        super().__init__((host, port), ServiceHandler)
+        self.service = service
+
+class ServiceHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def _send(self, status, data, headers=None):
+        body = json.dumps(data, ensure_ascii=False, default=str).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _read_json(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        return json.loads(self.rfile.read(length) or b'{}')
+
+    def do_GET(self):
+        if self.path == '/health':
+            self._send(200, {'status': 'ok'})
+        elif self.path == '/stats':
+            self._send(200, self.server.service.stats())
+        else:
+            self._send(404, {'error': 'not found'})
+
+    def do_POST(self):
+        if self.path not in ('/match', '/batch'):
+            self._send(404, {'error': 'not found'})
+            return
+        try:
+            payload = self._read_json()
+        except ValueError:
+            self._send(400, {'error': 'invalid JSON'})
+            return
+        if self.path == '/match':
+            queries = [payload.get('query')] if isinstance(payload, dict) else [None]
+        else:
+            queries = payload.get('queries') if isinstance(payload, dict) else None
+        if not isinstance(queries, list) or not all(isinstance(q, str) for q in queries):
+            self._send(400, {'error': "expected {'query': str} or {'queries': [str, ...]}"})
+            return
+        service = self.server.service
+        if len(queries) > service.max_pending:
+            self._send(413, {'error': f"batch of {len(queries)} rows exceeds limit {service.max_pending}"})
+            return
+        try:
+            results = service.match_many(queries)
+        except QueueFull as e:
+            self._send(503, {'error': f"queue full: {e}"}, headers={'Retry-After': '1'})
+            return
+        except Exception as e:
+            logging.error(f"Service request failed: {e}")
+            self._send(500, {'error': str(e)})
+            return
+        self._send(200, results[0] if self.path == '/match' else {'results': results})
+
+    def log_message(self, format, *args):
+        logging.debug(f"{self.address_string()} {format % args}")
+
+def serve(process, host=SERVICE_HOST, port=SERVICE_PORT, workers=MAX_WORKERS, max_pending=SERVICE_MAX_PENDING, stats=None, on_error=None):
+    """Запускает сервис и обслуживает запросы до Ctrl+C."""
+    service = MatchService(process, workers=workers, max_pending=max_pending, stats=stats, on_error=on_error)
+    server = ServiceServer(service, host, port)
+    logging.info(f"Matcher service on http://{host}:{server.server_address[1]} "
+                 f"({service.workers} workers, queue limit {service.max_pending} rows)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        logging.info("Matcher service stopped")
+    finally:
+        server.server_close()
+        service.close()
@@ -0,0 +1,58 @@
+import builtins
+import sys
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+# Замеры запуска: имя -> список секунд
+_timings = defaultdict(list)
+_lock = threading.Lock()
+_tracing = threading.local()
+
+def record(name, seconds):
+    with _lock:
+        _timings[name].append(seconds)
+
+@contextmanager
+def timed(name):
+    """Замеряет шаг запуска (поиск chromedriver, старт браузера)."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(name, time.perf_counter() - start)
+
+def trace_imports():
+    """Замеряет каждый впервые загружаемый модуль верхнего уровня (вложенные импорты входят в его время).
+    Включается до импортов main при --profile-startup."""
+    original = builtins.__import__
+
+    def traced_import(name, globals=None, locals=None, fromlist=(), level=0):
+        top = name.partition('.')[0]
+        if level or getattr(_tracing, 'depth', 0) or top in sys.modules:
+            return original(name, globals, locals, fromlist, level)
+        _tracing.depth = 1
+        start = time.perf_counter()
+        try:
+            return original(name, globals, locals, fromlist, level)
+        finally:
+            _tracing.depth = 0
+            record(f"import {top}", time.perf_counter() - start)
+
+    builtins.__import__ = traced_import
+
+def report(total=None):
+    """Строки отчета: импорты по убыванию времени, затем остальные шаги."""
+    with _lock:
+        timings = {name: list(values) for name, values in _timings.items()}
+    imports = sorted(((n, v) for n, v in timings.items() if n.startswith('import ')), key=lambda item: -sum(item[1]))
+    steps = sorted((n, v) for n, v in timings.items() if not n.startswith('import '))
+    lines = ['Startup profile:']
+    for name, values in imports + steps:
+        suffix = f" (x{len(values)}, first {values[0] * 1000:.1f} ms)" if len(values) > 1 else ''
+        lines.append(f"  {name:<32} {sum(values) * 1000:9.1f} ms{suffix}")
+    lines.append(f"  {'imports total':<32} {sum(sum(v) for _, v in imports) * 1000:9.1f} ms")
+    if total is not None:
+        lines.append(f"  {'total':<32} {total * 1000:9.1f} ms")
+    return lines